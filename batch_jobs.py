@@ -0,0 +1,98 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class BatchJob:
+    """Progress and results of one batch of questions"""
+
+    def __init__(self, total):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.status = "queued"
+        self.error = None
+        self.items = []  # in completion order
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def summary(self):
+        with self.lock:
+            elapsed = (self.finished or time.time()) - self.started if self.started else 0.0
+            return {
+                "id": self.id,
+                "status": self.status,
+                "total": self.total,
+                "completed": len(self.items),
+                "error": self.error,
+                "elapsed_seconds": elapsed,
+            }
+
+    def start(self):
+        with self.lock:
+            self.status = "running"
+            self.started = time.time()
+
+    def add(self, item):
+        with self.lock:
+            self.items.append(item)
+
+    def finish(self, error=None):
+        with self.lock:
+            self.status = "failed" if error else "done"
+            self.error = error
+            self.finished = time.time()
+
+    def to_dict(self, offset=0):
+        """Summary plus the items completed after the first `offset`"""
+        result = self.summary()
+        with self.lock:
+            result["offset"] = offset
+            result["items"] = self.items[offset:]
+        return result
+
+
+class BatchJobStore:
+    """Keep the most recent `keep` batch jobs for polling.
+
+    `run` executes a job in the calling (worker) thread by draining a
+    generator of per-item dicts, so clients can poll partial results while
+    later generation batches are still running.
+    """
+
+    def __init__(self, keep=100):
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def create(self, total):
+        job = BatchJob(total)
+        with self.lock:
+            self.jobs[job.id] = job
+            # Forget the oldest finished jobs beyond the limit
+            for job_id in list(self.jobs):
+                if len(self.jobs) <= self.keep:
+                    break
+                if self.jobs[job_id].status in ("done", "failed"):
+                    del self.jobs[job_id]
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def discard(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def run(self, job, fn, *args):
+        job.start()
+        try:
+            for item in fn(*args):
+                job.add(item)
+        except Exception as e:
+            job.finish(str(e))
+            raise
+        job.finish()
@@ -0,0 +1,82 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from stage_timer import StageTimer, merge
+
+
+class BatchScheduler:
+    """Collect concurrent single-item calls into batched handler calls.
+
+    `handler` takes a list of items and returns a list of results in the
+    same order, e.g. RAGChatbot.get_responses. A batch is dispatched as soon
+    as `max_batch_size` items are waiting or `max_wait_ms` has passed since
+    the first item of the batch arrived.
+
+    The handler runs on the scheduler thread, so its stage timings and
+    counts are collected there and added to the StageTimer of every caller
+    of `run`: each member waited for the whole batch, and token counts are
+    shared out evenly.
+    """
+
+    def __init__(self, handler, max_batch_size=8, max_wait_ms=10):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result"""
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def run(self, item):
+        """Blocking helper: submit one item and wait for its result"""
+        future = self.submit(item)
+        try:
+            return future.result()
+        finally:
+            if getattr(future, "stages", None) is not None:
+                merge(*future.stages)
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = [(item, future) for item, future in self._collect()
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            timer = StageTimer()
+            try:
+                with timer:
+                    results = self.handler([item for item, _ in batch])
+                self._attach_stages(batch, timer)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                self._attach_stages(batch, timer)
+                for _, future in batch:
+                    future.set_exception(e)
+
+    @staticmethod
+    def _attach_stages(batch, timer):
+        counts = {name: amount / len(batch) for name, amount in timer.counts.items()}
+        counts["batch_size"] = len(batch)
+        for _, future in batch:
+            future.stages = (dict(timer.stages), counts)
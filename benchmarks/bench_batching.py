@@ -0,0 +1,66 @@
+"""Compare tokens/sec of per-request generation against micro-batching.
+
+Usage: python benchmarks/bench_batching.py --concurrency 1 2 4 8 --requests 16
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from batch_scheduler import BatchScheduler
+from rag_chatbot import MODEL_NAME, RAGChatbot
+
+QUESTIONS = [
+    "Who does Alice follow down the rabbit hole?",
+    "What does Alice drink to become smaller?",
+    "Who is hosting the mad tea party?",
+    "What game does the Queen of Hearts play?",
+    "What is the Cheshire Cat known for?",
+    "Who is on trial at the end of the story?",
+    "What does the Caterpillar smoke?",
+    "What did the Mock Turtle used to be?",
+]
+
+
+def run(chatbot, answer, concurrency, num_requests):
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(num_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(answer, questions))
+    elapsed = time.perf_counter() - start
+    tokens = sum(
+        len(chatbot.tokenizer.encode(response, add_special_tokens=False))
+        for response, _, _ in results
+    )
+    return tokens / elapsed, num_requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching throughput benchmark")
+    parser.add_argument("--model", default=MODEL_NAME, help="Hugging Face model name")
+    parser.add_argument("--docs", default="./docs", help="Documents directory")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=16, help="Requests per run")
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    chatbot = RAGChatbot(docs_dir=args.docs, model_name=args.model)
+    chatbot.get_response(QUESTIONS[0])  # warm-up
+
+    print(f"{'concurrency':>11} {'mode':>10} {'tokens/s':>10} {'req/s':>8}")
+    for concurrency in args.concurrency:
+        batcher = BatchScheduler(
+            chatbot.get_responses,
+            max_batch_size=concurrency,
+            max_wait_ms=args.max_wait_ms
+        )
+        for mode, answer in (("single", chatbot.get_response), ("batched", batcher.run)):
+            tokens_per_s, requests_per_s = run(chatbot, answer, concurrency, args.requests)
+            print(f"{concurrency:>11} {mode:>10} {tokens_per_s:>10.1f} {requests_per_s:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark WebScraper against a generated site on a local HTTP server.
+
+Usage: python benchmarks/bench_crawler.py --pages 60 --concurrency 1 4 8 [--legacy]
+
+Each concurrency level is run browser-only, with the static HTTP fast path,
+and as a re-crawl of an unchanged site (conditional requests).
+"""
+import argparse
+import contextlib
+import functools
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scrape_website import WebScraper
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Page {i}</title></head>
+<body>
+<h1>Page {i}</h1>
+<p>{text}</p>
+<div id="late"></div>
+{links}
+<script>
+  // Some content arrives after load, like on client-rendered pages
+  setTimeout(() => {{ document.getElementById('late').innerText = 'Loaded later: {i}'; }}, {late_ms});
+</script>
+</body></html>
+"""
+
+
+SHELL = """<!DOCTYPE html>
+<html><head><title>App {i}</title></head>
+<body>
+<div id="root"></div>
+<script>
+  document.getElementById('root').innerHTML = `<h1>App page {i}</h1><p>{text}</p>{links}`;
+</script>
+</body></html>
+"""
+
+
+def build_site(root, num_pages, shell_every=5):
+    for i in range(num_pages):
+        targets = {(i + 1) % num_pages, (i * 7 + 3) % num_pages, (i * 13 + 5) % num_pages}
+        links = "\n".join(f'<a href="/page{t}.html">Page {t}</a>' for t in sorted(targets))
+        text = " ".join(f"Sentence {j} of page {i}." for j in range(50))
+        if shell_every and i % shell_every == shell_every - 1:
+            # Client-rendered page: needs the browser fallback
+            html = SHELL.format(i=i, text=text, links=links)
+        else:
+            html = PAGE.format(i=i, text=text, links=links, late_ms=200 if i % 3 == 0 else 0)
+        (root / f"page{i}.html").write_text(html, encoding="utf-8")
+    (root / "index.html").write_text(
+        '<html><body><a href="/page0.html">start</a></body></html>', encoding="utf-8"
+    )
+    (root / "robots.txt").write_text("User-agent: *\nAllow: /\n", encoding="utf-8")
+
+
+def serve(root, latency_ms):
+    class Handler(SimpleHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency_ms / 1000)
+            super().do_GET()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(Handler, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(base_url, recrawl=False, **kwargs):
+    with tempfile.TemporaryDirectory() as out_dir:
+        cwd = os.getcwd()
+        os.chdir(out_dir)
+        try:
+            if recrawl:
+                # Untimed first pass, so the timed one re-crawls with stored validators
+                with contextlib.redirect_stdout(io.StringIO()):
+                    WebScraper(base_url, delay=0, **kwargs).scrape()
+            scraper = WebScraper(base_url, delay=0, **kwargs)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                scraper.scrape()
+            return scraper.pages_done, time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawler throughput benchmark")
+    parser.add_argument("--pages", type=int, default=60)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Artificial server latency")
+    parser.add_argument("--shell-every", type=int, default=5,
+                        help="Every Nth page is a client-rendered shell (0 for none)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--legacy", action="store_true",
+                        help="Also time the old networkidle + 5s sleep behaviour (slow)")
+    parser.add_argument("--no-browser", action="store_true",
+                        help="Only time the static fetch paths, on a site without client-rendered "
+                             "pages (for hosts without a Chromium build)")
+    args = parser.parse_args()
+    if args.no_browser:
+        args.shell_every = 0
+
+    with tempfile.TemporaryDirectory() as site_dir:
+        build_site(Path(site_dir), args.pages, args.shell_every)
+        server = serve(Path(site_dir), args.latency_ms)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+        print(f"{'mode':>20} {'pages':>6} {'seconds':>8} {'pages/s':>8}")
+        runs = []
+        if args.legacy and not args.no_browser:
+            runs.append(("legacy sequential", dict(concurrency=1, fixed_wait_ms=5000)))
+        for concurrency in args.concurrency:
+            if not args.no_browser:
+                runs.append((f"browser-only x{concurrency}",
+                             dict(concurrency=concurrency, per_host_concurrency=concurrency, static_first=False)))
+            runs.append((f"static-first x{concurrency}",
+                         dict(concurrency=concurrency, per_host_concurrency=concurrency)))
+            runs.append((f"re-crawl x{concurrency}",
+                         dict(concurrency=concurrency, per_host_concurrency=concurrency, recrawl=True)))
+        for name, kwargs in runs:
+            pages, seconds = run(base_url, **kwargs)
+            print(f"{name:>20} {pages:>6} {seconds:>8.1f} {pages / seconds:>8.2f}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Closed-loop HTTP load test of chat_app at several API worker counts.
+
+Usage: python benchmarks/load_test.py --workers 1 2 4 --concurrency 32 --duration 30 --stub
+
+For each worker count chat_app is started with JUNCTION_API_WORKERS set
+(each worker retrieving on its own, see inference_server.py), waited on
+until /readyz answers 200, loaded by `concurrency` clients for `duration`
+seconds, and stopped. --stub generates with stub_llm_server.py instead of
+the real model, so the numbers show how the API and retrieval layers scale
+rather than GPU throughput. --url loads an already running server.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from stub_llm_server import serve as serve_stub
+
+QUESTIONS = [
+    "Who does Alice follow down the rabbit hole?",
+    "What does Alice drink to become smaller?",
+    "Who is hosting the mad tea party?",
+    "What game does the Queen of Hearts play?",
+    "What is the Cheshire Cat known for?",
+    "Who is on trial at the end of the story?",
+    "What does the Caterpillar smoke?",
+    "What did the Mock Turtle used to be?",
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def start_server(workers, env):
+    env = {**os.environ, **env, "JUNCTION_API_WORKERS": str(workers)}
+    # Own process group, so the uvicorn workers and the inference process stop together
+    return subprocess.Popen([sys.executable, "chat_app.py"], cwd=ROOT, env=env, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def wait_ready(url, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"chat_app exited with status {process.returncode}")
+        try:
+            if requests.get(f"{url}/readyz", timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def run_clients(url, endpoint, concurrency, duration, cached, tag):
+    """Each client sends its next request as soon as the previous one returns"""
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    counter = iter(range(10 ** 9))
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            n = next(counter)
+            question = QUESTIONS[n % len(QUESTIONS)]
+            if not cached:
+                question = f"{question} (request {tag}.{n})"  # defeat the response cache
+            start = time.perf_counter()
+            try:
+                status = session.post(f"{url}{endpoint}", json={"message": question}, timeout=600).status_code
+            except requests.RequestException:
+                status = "error"
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(client)
+    return latencies, statuses, time.perf_counter() - start
+
+
+def run_load(url, endpoint, concurrency, duration, cached, processes):
+    """Spread the clients over several processes, so the load generator's
+    own GIL does not cap the measured throughput"""
+    processes = min(processes, concurrency)
+    shares = [concurrency // processes + (i < concurrency % processes) for i in range(processes)]
+    latencies, statuses, elapsed = [], {}, 0.0
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [executor.submit(run_clients, url, endpoint, share, duration, cached, i)
+                   for i, share in enumerate(shares)]
+        for future in futures:
+            process_latencies, process_statuses, process_elapsed = future.result()
+            latencies.extend(process_latencies)
+            elapsed = max(elapsed, process_elapsed)
+            for status, n in process_statuses.items():
+                statuses[status] = statuses.get(status, 0) + n
+    return latencies, statuses, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker chat_app load test")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="API worker counts to test")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of load per run")
+    parser.add_argument("--endpoint", default="/chat")
+    parser.add_argument("--client-processes", type=int, default=4, help="Processes the clients are spread over")
+    parser.add_argument("--cached", action="store_true", help="Repeat questions, so the response cache answers")
+    parser.add_argument("--url", help="Load this running server instead of starting chat_app")
+    parser.add_argument("--ready-timeout", type=float, default=900, help="Seconds to wait for /readyz")
+    parser.add_argument("--stub", action="store_true", help="Generate with the stub model server")
+    parser.add_argument("--stub-token-latency-ms", type=float, default=5)
+    parser.add_argument("--stub-tokenizer", default="gpt2", help="Tokenizer for context budgeting with --stub")
+    args = parser.parse_args()
+
+    env = {}
+    if args.stub:
+        stub = serve_stub(token_latency_ms=args.stub_token_latency_ms)
+        env = {
+            "JUNCTION_GENERATION_BACKEND": "ollama",
+            "JUNCTION_GENERATION_URL": f"http://127.0.0.1:{stub.server_address[1]}",
+            "JUNCTION_GENERATION_TOKENIZER": args.stub_tokenizer,
+            "JUNCTION_GENERATION_CONCURRENCY": str(args.concurrency),
+        }
+
+    runs = [None] if args.url else args.workers
+    results = []
+    for workers in runs:
+        url = args.url or "http://127.0.0.1:8000"
+        process = None if args.url else start_server(workers, env)
+        try:
+            wait_ready(url, args.ready_timeout, process)
+            latencies, statuses, elapsed = run_load(url, args.endpoint, args.concurrency, args.duration, args.cached,
+                                                  args.client_processes)
+        finally:
+            if process is not None:
+                stop_server(process)
+        results.append((workers, len(latencies) / elapsed, latencies, statuses))
+
+    print(f"{'workers':>7} {'req/s':>8} {'scaling':>8} {'p50 ms':>8} {'p95 ms':>8}  responses")
+    baseline = results[0][1] or None
+    for workers, throughput, latencies, statuses in results:
+        scaling = f"{throughput / baseline:.2f}x" if baseline else "-"
+        print(f"{workers or '-':>7} {throughput:>8.1f} {scaling:>8} {percentile(latencies, 50) * 1000:>8.0f} "
+              f"{percentile(latencies, 95) * 1000:>8.0f}  {dict(sorted(statuses.items(), key=str))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"\w+(?:[-./:]\w+)*")
+
+
+def tokenize(text):
+    """Lowercased word tokens. Identifiers such as "ABC-123/4" are kept
+    whole and also split into their parts so either form matches."""
+    tokens = []
+    for match in TOKEN_RE.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-./:]", token) if part)
+    return tokens
+
+
+class Segment:
+    """One immutable on-disk segment.
+
+    Files (prefix = segment name):
+      .terms.json    sorted term list
+      .offsets.npy   int64 start of each term's postings (+ final end)
+      .docs.bin      uint32 local doc numbers, grouped by term
+      .tfs.bin       uint16 term frequencies, parallel to .docs.bin
+      .meta.json     chunk ids and total length of the segment
+      .lengths.npy   uint32 token count per doc
+    Postings are memory-mapped, so only the lexicon lives in RAM.
+    """
+
+    def __init__(self, directory, name):
+        self.name = name
+        prefix = str(Path(directory) / name)
+        terms = json.loads(Path(prefix + ".terms.json").read_text(encoding="utf-8"))
+        self.lexicon = {term: i for i, term in enumerate(terms)}
+        self.offsets = np.load(prefix + ".offsets.npy")
+        meta = json.loads(Path(prefix + ".meta.json").read_text(encoding="utf-8"))
+        self.chunk_ids = meta["chunk_ids"]
+        self.total_length = meta["total_length"]
+        self.lengths = np.load(prefix + ".lengths.npy")
+        num_postings = int(self.offsets[-1])
+        self.docs = np.memmap(prefix + ".docs.bin", dtype=np.uint32, mode="r", shape=(num_postings,)) \
+            if num_postings else np.zeros(0, dtype=np.uint32)
+        self.tfs = np.memmap(prefix + ".tfs.bin", dtype=np.uint16, mode="r", shape=(num_postings,)) \
+            if num_postings else np.zeros(0, dtype=np.uint16)
+        self.live = np.ones(len(self.chunk_ids), dtype=bool)
+
+    def postings(self, term):
+        i = self.lexicon.get(term)
+        if i is None:
+            return None, None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.docs[start:end], self.tfs[start:end]
+
+    def files(self, directory):
+        return [Path(directory) / f"{self.name}{suffix}" for suffix in
+                (".terms.json", ".offsets.npy", ".docs.bin", ".tfs.bin", ".meta.json", ".lengths.npy")]
+
+
+def write_segment(directory, name, chunk_ids, lengths, term_postings):
+    """Write a segment from {term: [(local doc, tf), ...]} or an iterator of
+    (term, docs array, tfs array) pairs sorted by term"""
+    prefix = str(Path(directory) / name)
+    items = sorted(term_postings.items()) if isinstance(term_postings, dict) else term_postings
+    terms, offsets = [], [0]
+    with open(prefix + ".docs.bin", "wb") as docs_file, open(prefix + ".tfs.bin", "wb") as tfs_file:
+        for term, postings in items:
+            if isinstance(postings, tuple):
+                docs, tfs = postings
+            else:
+                docs = np.fromiter((doc for doc, _ in postings), dtype=np.uint32, count=len(postings))
+                tfs = np.fromiter((min(tf, 65535) for _, tf in postings), dtype=np.uint16, count=len(postings))
+            if not len(docs):
+                continue
+            docs_file.write(np.asarray(docs, dtype=np.uint32).tobytes())
+            tfs_file.write(np.asarray(tfs, dtype=np.uint16).tobytes())
+            terms.append(term)
+            offsets.append(offsets[-1] + len(docs))
+    np.save(prefix + ".offsets.npy", np.asarray(offsets, dtype=np.int64))
+    np.save(prefix + ".lengths.npy", np.asarray(lengths, dtype=np.uint32))
+    Path(prefix + ".terms.json").write_text(json.dumps(terms, ensure_ascii=False), encoding="utf-8")
+    Path(prefix + ".meta.json").write_text(
+        json.dumps({"chunk_ids": list(chunk_ids), "total_length": int(sum(lengths))}),
+        encoding="utf-8"
+    )
+
+
+class BM25Index:
+    """Segmented BM25 index over chunk ids, stored next to the FAISS index.
+
+    Added chunks are buffered and flushed into a new segment every
+    `flush_every` chunks and on commit. Deletions are tombstones until the
+    segments are merged, which happens once there are more than
+    `max_segments` of them.
+    """
+
+    def __init__(self, directory, k1=1.2, b=0.75, flush_every=50000, max_segments=8):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.flush_every = flush_every
+        self.max_segments = max_segments
+        meta_path = self.directory / "index.json"
+        meta = json.loads(meta_path.read_text(encoding="utf-8")) if meta_path.exists() else {}
+        self.next_segment = meta.get("next_segment", 0)
+        self.deleted = set(meta.get("deleted", []))
+        self.segments = [Segment(self.directory, name) for name in meta.get("segments", [])]
+        self.location = {}  # chunk id -> (segment, local doc)
+        for segment in self.segments:
+            for doc, chunk_id in enumerate(segment.chunk_ids):
+                if chunk_id in self.deleted:
+                    segment.live[doc] = False
+                else:
+                    self.location[chunk_id] = (segment, doc)
+        self._reset_pending()
+
+    def __len__(self):
+        return len(self.location) + len(self.pending_ids)
+
+    def _reset_pending(self):
+        self.pending_ids = []
+        self.pending_lengths = []
+        self.pending_postings = defaultdict(list)
+
+    def add(self, chunk_ids, texts):
+        for chunk_id, text in zip(chunk_ids, texts):
+            counts = Counter(tokenize(text))
+            doc = len(self.pending_ids)
+            self.pending_ids.append(chunk_id)
+            self.pending_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.pending_postings[term].append((doc, tf))
+        if len(self.pending_ids) >= self.flush_every:
+            self.flush()
+
+    def delete(self, chunk_ids):
+        chunk_ids = set(chunk_ids)
+        if self.pending_ids and chunk_ids & set(self.pending_ids):
+            self.flush()
+        for chunk_id in chunk_ids:
+            location = self.location.pop(chunk_id, None)
+            if location is not None:
+                segment, doc = location
+                segment.live[doc] = False
+                self.deleted.add(chunk_id)
+
+    def flush(self):
+        """Write buffered chunks as a new segment"""
+        if not self.pending_ids:
+            return
+        name = f"seg_{self.next_segment:06d}"
+        self.next_segment += 1
+        write_segment(self.directory, name, self.pending_ids, self.pending_lengths, self.pending_postings)
+        self._reset_pending()
+        segment = Segment(self.directory, name)
+        self.segments.append(segment)
+        for doc, chunk_id in enumerate(segment.chunk_ids):
+            self.location[chunk_id] = (segment, doc)
+
+    def merge(self):
+        """Rewrite all segments as one, dropping deleted chunks"""
+        old = self.segments
+        name = f"seg_{self.next_segment:06d}"
+        self.next_segment += 1
+
+        chunk_ids, lengths, remaps, base = [], [], [], 0
+        for segment in old:
+            remap = np.full(len(segment.chunk_ids), -1, dtype=np.int64)
+            live_docs = np.flatnonzero(segment.live)
+            remap[live_docs] = np.arange(base, base + len(live_docs))
+            base += len(live_docs)
+            chunk_ids.extend(segment.chunk_ids[doc] for doc in live_docs)
+            lengths.extend(segment.lengths[live_docs].tolist())
+            remaps.append(remap)
+
+        def merged_postings():
+            for term in sorted(set().union(*(segment.lexicon for segment in old))):
+                all_docs, all_tfs = [], []
+                for segment, remap in zip(old, remaps):
+                    docs, tfs = segment.postings(term)
+                    if docs is None:
+                        continue
+                    new_docs = remap[docs]
+                    keep = new_docs >= 0
+                    all_docs.append(new_docs[keep])
+                    all_tfs.append(tfs[keep])
+                if all_docs:
+                    yield term, (np.concatenate(all_docs), np.concatenate(all_tfs))
+
+        write_segment(self.directory, name, chunk_ids, lengths, merged_postings())
+        self.segments = [Segment(self.directory, name)]
+        self.deleted = set()
+        self.location = {chunk_id: (self.segments[0], doc) for doc, chunk_id in enumerate(chunk_ids)}
+        self._write_meta()
+        for segment in old:
+            for path in segment.files(self.directory):
+                path.unlink(missing_ok=True)
+
+    def commit(self):
+        """Flush, merge if needed and persist the segment list"""
+        self.flush()
+        if len(self.segments) > self.max_segments:
+            self.merge()
+        else:
+            self._write_meta()
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segments = []
+        self.deleted = set()
+        self.location = {}
+        self.next_segment = 0
+        self._reset_pending()
+
+    def _write_meta(self):
+        meta_path = self.directory / "index.json"
+        tmp_path = meta_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({
+            "segments": [segment.name for segment in self.segments],
+            "deleted": sorted(self.deleted),
+            "next_segment": self.next_segment
+        }), encoding="utf-8")
+        os.replace(tmp_path, meta_path)
+
+    def search(self, query, k=10):
+        """Return the top-k (chunk id, score) pairs for a query"""
+        terms = set(tokenize(query))
+        num_docs = len(self.location)
+        if not terms or not num_docs:
+            return []
+        total_length = sum(
+            segment.total_length - int(segment.lengths[~segment.live].sum())
+            for segment in self.segments
+        )
+        avgdl = total_length / num_docs or 1.0
+
+        df = Counter()
+        for segment in self.segments:
+            for term in terms:
+                docs, _ = segment.postings(term)
+                if docs is not None:
+                    df[term] += int(segment.live[docs].sum())
+
+        hits = []
+        for segment in self.segments:
+            scores = np.zeros(len(segment.chunk_ids), dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * segment.lengths / avgdl)
+            for term in terms:
+                docs, tfs = segment.postings(term)
+                if docs is None or not df[term]:
+                    continue
+                idf = math.log(1 + (num_docs - df[term] + 0.5) / (df[term] + 0.5))
+                tfs = tfs.astype(np.float32)
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+            scores[~segment.live] = 0
+            top = np.argsort(-scores)[:k] if len(scores) <= k else np.argpartition(-scores, k)[:k]
+            hits.extend(
+                (segment.chunk_ids[doc], float(scores[doc])) for doc in top if scores[doc] > 0
+            )
+        hits.sort(key=lambda hit: -hit[1])
+        return hits[:k]
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuse several ranked id lists; returns ids sorted by fused score"""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] += 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda item: -scores[item])
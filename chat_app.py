@@ -1,9 +1,27 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
+from typing import List
 import uvicorn
-from rag_chatbot import RAGChatbot
+import asyncio
+import inspect
+import json
+import multiprocessing
+import os
+import secrets
+import tempfile
+import threading
+import time
+from pathlib import Path
+import config
+from batch_jobs import BatchJobStore
+from inference_pool import InferencePool, QueueFullError, QueueTimeoutError, timed_out
+from inference_server import (InferenceClient, RemoteJobStore, build_handlers, create_chatbot, inference_workers,
+                              push_metrics, render_metrics, serve)
+from metrics import Metrics
+from stage_timer import StageTimer, add_count_listener, add_listener
 
 # FastAPI app setup
 app = FastAPI()
@@ -18,26 +36,326 @@ app.add_middleware(
 class Query(BaseModel):
     message: str
 
+class BatchQuery(BaseModel):
+    messages: List[str]
 
-# Initialize chatbot
+
+# Initialize chatbot. Components load in a background thread once the
+# server is up, so health checks are answered during the cold start.
 print("Starting initialization...")
-chatbot = RAGChatbot()
-print("Initialization complete!")
+if config.INFERENCE_SOCKET:
+    # One of several API workers: retrieval, tokenization and packing run
+    # here against the shared on-disk index; the local model, batch job
+    # state and metrics are shared through one process (see inference_server.py)
+    workers = config.INFERENCE_WORKERS
+    authkey = config.INFERENCE_AUTHKEY.encode() if config.INFERENCE_AUTHKEY else None
+    client = InferenceClient(config.INFERENCE_SOCKET, authkey, connections=workers + 2)
+    chatbot = create_chatbot(client)
+    handlers = build_handlers(chatbot, batch=False)
+else:
+    workers = inference_workers()
+    client = None
+    chatbot = create_chatbot()
+    handlers = build_handlers(chatbot)
+started_at = time.time()
+
+# Generation runs in a bounded worker pool so the event loop stays free
+pool = InferencePool(
+    workers=workers,
+    max_queue=config.INFERENCE_QUEUE_SIZE,
+    timeout=config.INFERENCE_TIMEOUT
+)
+
+# Prometheus metrics: stage timings and token counts from every thread,
+# plus per-request latency recorded by the instrumented wrappers below
+metrics = Metrics(
+    slow_request_seconds=config.SLOW_REQUEST_SECONDS,
+    slow_request_log=config.SLOW_REQUEST_LOG or None
+)
+add_listener(metrics.on_stage)
+add_count_listener(metrics.on_count)
+metrics.add_gauge("rag_queue_depth", "Requests waiting for an inference worker", lambda: pool.queue_depth)
+metrics.add_gauge("rag_in_flight_requests", "Requests admitted to the inference pool", lambda: pool.admitted)
+metrics.add_gauge("rag_running_requests", "Requests being processed by a worker", lambda: pool.running)
+metrics.add_gauge("rag_ready", "1 once all components have loaded", lambda: int(chatbot.ready.is_set()), min)
+
+def instrumented(endpoint, fn):
+    """Wrap fn(question) to run under a StageTimer and record request metrics.
+
+    A request's outcome is recorded once, here, when its work ends; if the
+    client already got a 504 it is recorded as a timeout.
+    """
+    def run(question):
+        start = time.perf_counter()
+        status = "ok"
+        with StageTimer() as timer:
+            try:
+                return fn(question)
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                status = "timeout" if timed_out() else status
+                metrics.observe_request(endpoint, time.perf_counter() - start, status, timer, str(question)[:200])
+    return run
+
+def instrumented_stream(endpoint, fn):
+    """instrumented() for generator functions"""
+    def run(question, **kwargs):
+        start = time.perf_counter()
+        status = "ok"
+        with StageTimer() as timer:
+            try:
+                yield from fn(question, **kwargs)
+            except Exception:
+                status = "error"
+                raise
+            finally:
+                status = "timeout" if timed_out() else status
+                metrics.observe_request(endpoint, time.perf_counter() - start, status, timer, str(question)[:200])
+    return run
+
+chat_answer = instrumented("/chat", handlers["answer"])
+reasoning_answer = instrumented("/chat/reasoning", handlers["reasoning"])
+self_rag_answer = instrumented("/chat/self-rag", handlers["self_rag"])
+stream_answer = instrumented_stream("/chat/stream", handlers["stream"])
+# Batch answers are streamed back or collected in a pollable job
+batch_answer = instrumented_stream("/chat/batch", handlers["batch"])
+
+# Job state lives in the shared process when there are several API workers,
+# since a poll may reach a different worker than the one running the job
+jobs = RemoteJobStore(client) if client else BatchJobStore(keep=config.BATCH_JOBS_KEEP)
+
+def create_job(questions):
+    job = jobs.create(len(questions))
+    try:
+        pool.submit(jobs.run, job, batch_answer, questions)
+    except QueueFullError:
+        jobs.discard(job.id)
+        raise
+    return job.summary()
+
+def get_job(job_id, offset=0):
+    job = jobs.get(job_id)
+    return None if job is None else job.to_dict(offset)
+
+def warm_up():
+    try:
+        if client:
+            # The shared process brings the index up to date first
+            client.wait_ready()
+        chatbot.warm_up()
+        print("Initialization complete!")
+    except Exception as e:
+        chatbot.load_error = chatbot.load_error or str(e)
+        print(f"Initialization failed: {e}")
+
+@app.on_event("startup")
+async def start_warm_up():
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if client:
+        threading.Thread(target=push_metrics, args=(client, metrics), name="metrics-push", daemon=True).start()
+
+def require_ready():
+    if not chatbot.ready.is_set():
+        detail = "Initialization failed" if chatbot.load_error else "Model is still loading"
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+def timeout_error(e, endpoint, seconds=None):
+    """504 for a timed out request. Requests that started are recorded by
+    their instrumented wrapper; only those that never left the queue are
+    recorded here."""
+    if isinstance(e, QueueTimeoutError):
+        metrics.observe_request(endpoint, seconds or pool.timeout, "timeout")
+    return HTTPException(status_code=504, detail="Generation timed out")
+
+def busy_error(e, endpoint):
+    metrics.requests.inc(endpoint=endpoint, status="rejected")
+    return HTTPException(
+        status_code=503,
+        detail=str(e),
+        headers={"Retry-After": str(pool.retry_after())}
+    )
 
 @app.post("/chat")
 async def chat(query: Query):
+    require_ready()
+    try:
+        response, sources, context = await pool.run(chat_answer, query.message)
+    except QueueFullError as e:
+        raise busy_error(e, "/chat")
+    except asyncio.TimeoutError as e:
+        raise timeout_error(e, "/chat")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "response": response,
+        "sources": sources,
+        "context": context
+    }
+
+@app.post("/chat/reasoning")
+async def chat_reasoning(query: Query):
+    require_ready()
     try:
-        response, sources, context = chatbot.get_response(query.message)
-        return {
-            "response": response,
-            "sources": sources,
-            "context": context
-        }
+        return await pool.run(reasoning_answer, query.message)
+    except QueueFullError as e:
+        raise busy_error(e, "/chat/reasoning")
+    except asyncio.TimeoutError as e:
+        raise timeout_error(e, "/chat/reasoning")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat/self-rag")
+async def chat_self_rag(query: Query):
+    require_ready()
+    try:
+        return await pool.run(self_rag_answer, query.message)
+    except QueueFullError as e:
+        raise busy_error(e, "/chat/self-rag")
+    except asyncio.TimeoutError as e:
+        raise timeout_error(e, "/chat/self-rag")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def sse_events(events):
+    """Format RAGChatbot.stream_response events as Server-Sent Events"""
+    try:
+        async for event in events:
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    except asyncio.TimeoutError as e:
+        timeout_error(e, "/chat/stream")
+        yield f"event: error\ndata: {json.dumps({'event': 'error', 'detail': 'Generation timed out'})}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'event': 'error', 'detail': str(e)})}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(query: Query):
+    require_ready()
+    try:
+        events = pool.stream(stream_answer, query.message)
+    except QueueFullError as e:
+        raise busy_error(e, "/chat/stream")
+    return StreamingResponse(
+        sse_events(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def validate_batch(batch):
+    if not batch.messages:
+        raise HTTPException(status_code=400, detail="messages must not be empty")
+    if len(batch.messages) > config.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {config.BATCH_MAX_QUESTIONS} messages per batch"
+        )
+
+@app.post("/chat/batch")
+async def chat_batch(batch: BatchQuery):
+    """Answer many questions; one NDJSON line per answer as batches finish"""
+    require_ready()
+    validate_batch(batch)
+    try:
+        items = pool.stream(batch_answer, batch.messages, timeout=config.BATCH_TIMEOUT, stoppable=True)
+    except QueueFullError as e:
+        raise busy_error(e, "/chat/batch")
+
+    async def ndjson():
+        try:
+            async for item in items:
+                yield json.dumps(item) + "\n"
+        except asyncio.TimeoutError as e:
+            timeout_error(e, "/chat/batch", config.BATCH_TIMEOUT)
+            yield json.dumps({"error": "Batch timed out"}) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/chat/batch/jobs")
+async def create_batch_job(batch: BatchQuery):
+    """Start a batch in the background; poll GET /chat/batch/jobs/{id}"""
+    require_ready()
+    validate_batch(batch)
+    try:
+        summary = await asyncio.to_thread(create_job, batch.messages)
+    except QueueFullError as e:
+        raise busy_error(e, "/chat/batch")
+    return JSONResponse(summary, status_code=202)
+
+@app.get("/chat/batch/jobs/{job_id}")
+async def get_batch_job(job_id: str, offset: int = 0):
+    """Job progress plus the answers completed after the first `offset`"""
+    job = await asyncio.to_thread(get_job, job_id, offset)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown batch job")
+    return job
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and its event loop is responsive. A
+    failed warm-up never recovers, so it answers 503 and the orchestrator
+    restarts the process."""
+    if chatbot.load_error:
+        body = {"status": "failed", "error": chatbot.load_error, "uptime_seconds": time.time() - started_at}
+        return JSONResponse(body, status_code=503)
+    return {"status": "ok", "uptime_seconds": time.time() - started_at}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once every component has loaded, 503 before that"""
+    components = await asyncio.to_thread(chatbot.load_status)
+    body = {
+        "ready": chatbot.ready.is_set(),
+        "error": chatbot.load_error,
+        "components": components,
+        "uptime_seconds": time.time() - started_at
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Every API worker's metrics (and the shared process's) when there are several"""
+    text = await asyncio.to_thread(render_metrics, client, metrics) if client else metrics.render()
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return await asyncio.to_thread(handlers["cache_stats"])
+
 # Mount static files (HTML interface)
 app.mount("/", StaticFiles(directory=".", html=True), name="static")
 
+def run_workers():
+    """Serve with API_WORKERS uvicorn processes sharing one inference
+    process, started here unless INFERENCE_SOCKET names a running one"""
+    process = None
+    if not config.INFERENCE_SOCKET:
+        address = str(Path(tempfile.gettempdir()) / f"junction-inference-{os.getpid()}.sock")
+        authkey = secrets.token_hex(16)
+        # Read by the worker processes when they import this module
+        os.environ["JUNCTION_INFERENCE_SOCKET"] = address
+        os.environ["JUNCTION_INFERENCE_AUTHKEY"] = authkey
+        process = multiprocessing.get_context("spawn").Process(
+            target=serve, args=(address, authkey.encode()), name="inference"
+        )
+        process.start()
+    # Each worker imports the whole retrieval stack before it can answer
+    # uvicorn's health checks, which may take longer than the 5s default
+    options = {}
+    if "timeout_worker_healthcheck" in inspect.signature(uvicorn.Config).parameters:
+        options["timeout_worker_healthcheck"] = 120
+    try:
+        uvicorn.run("chat_app:app", host="0.0.0.0", port=8000, workers=config.API_WORKERS, **options)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+            Path(address).unlink(missing_ok=True)
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if config.API_WORKERS > 1:
+        run_workers()
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -33,3 +33,91 @@ def setup_token(token):
     print(f"Token saved to {config_path}")
     print("Make sure to add this path to your .gitignore!")
     
+
+
+# Inference worker pool used by chat_app
+INFERENCE_WORKERS = int(os.getenv("JUNCTION_INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("JUNCTION_INFERENCE_QUEUE_SIZE", "16"))
+INFERENCE_TIMEOUT = float(os.getenv("JUNCTION_INFERENCE_TIMEOUT", "300"))
+
+# Multi-process serving: API_WORKERS > 1 runs that many uvicorn workers,
+# each retrieving against the same on-disk index, plus one shared process
+# (index updates, the local model, batch jobs, metrics) reached over a Unix
+# socket; setting INFERENCE_SOCKET makes chat_app a worker of a running one.
+# INFERENCE_WORKERS then bounds concurrent requests per API worker.
+API_WORKERS = int(os.getenv("JUNCTION_API_WORKERS", "1"))
+INFERENCE_SOCKET = os.getenv("JUNCTION_INFERENCE_SOCKET", "")
+INFERENCE_AUTHKEY = os.getenv("JUNCTION_INFERENCE_AUTHKEY", "")
+
+# Micro-batching of concurrent /chat requests (1 disables batching)
+BATCH_MAX_SIZE = int(os.getenv("JUNCTION_BATCH_MAX_SIZE", "1"))
+BATCH_MAX_WAIT_MS = float(os.getenv("JUNCTION_BATCH_MAX_WAIT_MS", "10"))
+
+# Answer cache (0 entries disables it; similarity threshold 0 disables the semantic tier)
+RESPONSE_CACHE_ENTRIES = int(os.getenv("JUNCTION_RESPONSE_CACHE_ENTRIES", "1024"))
+RESPONSE_CACHE_MB = float(os.getenv("JUNCTION_RESPONSE_CACHE_MB", "64"))
+RESPONSE_CACHE_TTL = float(os.getenv("JUNCTION_RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("JUNCTION_RESPONSE_CACHE_SIMILARITY", "0"))
+
+# FAISS index: flat, ivf_flat, ivf_pq or hnsw. nlist 0 picks 4*sqrt(#vectors).
+INDEX_TYPE = os.getenv("JUNCTION_INDEX_TYPE", "flat")
+INDEX_NLIST = int(os.getenv("JUNCTION_INDEX_NLIST", "0"))
+INDEX_PQ_M = int(os.getenv("JUNCTION_INDEX_PQ_M", "16"))
+INDEX_HNSW_M = int(os.getenv("JUNCTION_INDEX_HNSW_M", "32"))
+INDEX_TRAIN_SAMPLE = int(os.getenv("JUNCTION_INDEX_TRAIN_SAMPLE", "100000"))
+INDEX_NPROBE = int(os.getenv("JUNCTION_INDEX_NPROBE", "16"))
+INDEX_EF_SEARCH = int(os.getenv("JUNCTION_INDEX_EF_SEARCH", "64"))
+# Memory-map IVF inverted lists; flat and HNSW indexes and the docstore stay in RAM
+INDEX_MMAP = os.getenv("JUNCTION_INDEX_MMAP", "0") == "1"
+
+# Document ingestion: loader/splitter processes (0 = one per CPU) and embedding batch size
+INGEST_WORKERS = int(os.getenv("JUNCTION_INGEST_WORKERS", "0"))
+EMBED_BATCH_SIZE = int(os.getenv("JUNCTION_EMBED_BATCH_SIZE", "256"))
+
+# Hybrid retrieval: BM25 + dense candidates fused with reciprocal-rank fusion
+HYBRID_SEARCH = os.getenv("JUNCTION_HYBRID_SEARCH", "1") == "1"
+HYBRID_CANDIDATES = int(os.getenv("JUNCTION_HYBRID_CANDIDATES", "20"))
+RRF_K = int(os.getenv("JUNCTION_RRF_K", "60"))
+
+# Optional cross-encoder rerank stage between retrieval and prompt assembly
+RERANK = os.getenv("JUNCTION_RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("JUNCTION_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("JUNCTION_RERANK_CANDIDATES", "20"))
+RERANK_TOP_K = int(os.getenv("JUNCTION_RERANK_TOP_K", "3"))
+RERANK_BUDGET_MS = float(os.getenv("JUNCTION_RERANK_BUDGET_MS", "150"))
+
+# Prompt context budget in model tokens (0 disables packing and joins raw chunks)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("JUNCTION_CONTEXT_TOKEN_BUDGET", "1500"))
+
+# Reasoning DAG executor (/chat/reasoning): subqueries per generation batch
+DAG_MAX_PARALLEL = int(os.getenv("JUNCTION_DAG_MAX_PARALLEL", "4"))
+DAG_MAX_NODES = int(os.getenv("JUNCTION_DAG_MAX_NODES", "12"))
+
+# Self-RAG verification pipeline (/chat/self-rag)
+SELF_RAG_MAX_EXPERT_CALLS = int(os.getenv("JUNCTION_SELF_RAG_MAX_EXPERT_CALLS", "3"))
+SELF_RAG_CANDIDATES = int(os.getenv("JUNCTION_SELF_RAG_CANDIDATES", "5"))
+
+# Generation backend: "transformers" runs the model in-process; "ollama" or
+# "openai" call a model server at GENERATION_URL (see stub_llm_server.py)
+GENERATION_BACKEND = os.getenv("JUNCTION_GENERATION_BACKEND", "transformers")
+GENERATION_URL = os.getenv("JUNCTION_GENERATION_URL", "http://localhost:11434")
+GENERATION_MODEL = os.getenv("JUNCTION_GENERATION_MODEL", "mistral")
+GENERATION_CONCURRENCY = int(os.getenv("JUNCTION_GENERATION_CONCURRENCY", "4"))
+GENERATION_TIMEOUT = float(os.getenv("JUNCTION_GENERATION_TIMEOUT", "120"))
+GENERATION_API_KEY = os.getenv("JUNCTION_GENERATION_API_KEY", "")
+# Hub tokenizer used to count context tokens with a server backend (default: the model name)
+GENERATION_TOKENIZER = os.getenv("JUNCTION_GENERATION_TOKENIZER", "")
+
+# Reuse the prefill key/values of fixed prompt prefixes (transformers backend)
+PREFIX_CACHE = os.getenv("JUNCTION_PREFIX_CACHE", "1") == "1"
+PREFIX_CACHE_TOKENS = int(os.getenv("JUNCTION_PREFIX_CACHE_TOKENS", "16384"))
+
+# Requests slower than this many seconds get their stage breakdown logged (0 disables)
+SLOW_REQUEST_SECONDS = float(os.getenv("JUNCTION_SLOW_REQUEST_SECONDS", "0"))
+SLOW_REQUEST_LOG = os.getenv("JUNCTION_SLOW_REQUEST_LOG", "slow_requests.jsonl")
+
+# /chat/batch: questions per padded generation batch, limits and job retention
+BATCH_GENERATION_SIZE = int(os.getenv("JUNCTION_BATCH_GENERATION_SIZE", "16"))
+BATCH_MAX_QUESTIONS = int(os.getenv("JUNCTION_BATCH_MAX_QUESTIONS", "1000"))
+BATCH_TIMEOUT = float(os.getenv("JUNCTION_BATCH_TIMEOUT", "3600"))
+BATCH_JOBS_KEEP = int(os.getenv("JUNCTION_BATCH_JOBS_KEEP", "100"))
@@ -0,0 +1,109 @@
+import re
+
+
+class ContextPacker:
+    """Assemble retrieved chunks into a prompt context under a token budget.
+
+    Chunks from the same source that overlap or touch (by `start_index`
+    metadata, or by a shared suffix/prefix for chunks indexed without it)
+    are merged, repeated paragraphs are dropped, and passages are added in
+    retrieval order until `budget_tokens` model tokens are used; the last
+    passage that does not fit is truncated.
+    """
+
+    def __init__(self, tokenizer, budget_tokens=1500, min_overlap=20, max_overlap=400, min_tail_tokens=32):
+        self.tokenizer = tokenizer
+        self.budget_tokens = budget_tokens
+        self.min_overlap = min_overlap
+        self.max_overlap = max_overlap
+        self.min_tail_tokens = min_tail_tokens
+
+    def count(self, text):
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def text_overlap(self, left, right):
+        """Length of the longest suffix of left that is a prefix of right"""
+        for size in range(min(len(left), len(right), self.max_overlap), self.min_overlap - 1, -1):
+            if left[-size:] == right[:size]:
+                return size
+        return 0
+
+    def merge(self, docs):
+        """Merge overlapping chunks per source; returns [rank, source, text] passages"""
+        by_source = {}
+        for rank, doc in enumerate(docs):
+            source = doc.metadata.get("source", "Unknown source")
+            by_source.setdefault(source, []).append((rank, doc))
+
+        passages = []
+        for source, items in by_source.items():
+            if all("start_index" in doc.metadata for _, doc in items):
+                items.sort(key=lambda item: item[1].metadata["start_index"])
+                current = None
+                for rank, doc in items:
+                    start = doc.metadata["start_index"]
+                    end = start + len(doc.page_content)
+                    if current and start <= current["end"]:
+                        if end > current["end"]:
+                            current["text"] += doc.page_content[current["end"] - start:]
+                            current["end"] = end
+                        current["rank"] = min(current["rank"], rank)
+                    else:
+                        current = {"rank": rank, "text": doc.page_content, "end": end}
+                        passages.append(current)
+                    current["source"] = source
+            else:
+                merged = []
+                for rank, doc in items:
+                    text = doc.page_content
+                    for passage in merged:
+                        if text in passage["text"]:
+                            break
+                        overlap = self.text_overlap(passage["text"], text)
+                        if overlap:
+                            passage["text"] += text[overlap:]
+                            break
+                        overlap = self.text_overlap(text, passage["text"])
+                        if overlap:
+                            passage["text"] = text + passage["text"][overlap:]
+                            break
+                    else:
+                        merged.append({"rank": rank, "text": text, "source": source})
+                        continue
+                    passage["rank"] = min(passage["rank"], rank)
+                passages.extend(merged)
+        passages.sort(key=lambda passage: passage["rank"])
+        return passages
+
+    def deduplicate(self, passages):
+        """Drop paragraphs that already appeared in a higher-ranked passage"""
+        seen = set()
+        for passage in passages:
+            kept = []
+            for paragraph in passage["text"].split("\n"):
+                key = re.sub(r"\s+", " ", paragraph).strip().lower()
+                if key and key in seen:
+                    continue
+                seen.add(key)
+                kept.append(paragraph)
+            passage["text"] = "\n".join(kept).strip()
+        return [passage for passage in passages if passage["text"]]
+
+    def pack(self, docs):
+        """Return (context, sources) for the retrieved documents"""
+        passages = self.deduplicate(self.merge(docs))
+        remaining = self.budget_tokens
+        texts, sources = [], []
+        for passage in passages:
+            tokens = self.tokenizer.encode(passage["text"], add_special_tokens=False)
+            if len(tokens) > remaining:
+                if remaining < self.min_tail_tokens:
+                    break
+                passage["text"] = self.tokenizer.decode(tokens[:remaining], skip_special_tokens=True)
+                tokens = tokens[:remaining]
+            texts.append(passage["text"])
+            sources.append(passage["source"])
+            remaining -= len(tokens)
+            if remaining <= 0:
+                break
+        return "\n\n".join(texts), sources
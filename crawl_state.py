@@ -0,0 +1,168 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS frontier (
+    url TEXT PRIMARY KEY,
+    status TEXT NOT NULL,        -- pending, done, failed or skipped
+    seq INTEGER NOT NULL         -- discovery order, so a resume keeps crawling breadth-first
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT,
+    links TEXT,                  -- JSON list of outgoing links, reused on 304
+    fetched_at REAL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    url TEXT PRIMARY KEY,
+    link TEXT NOT NULL,          -- JSON {text, url, type} as found on the page
+    status TEXT NOT NULL,        -- pending, downloaded, duplicate, skipped or failed
+    path TEXT,
+    content_hash TEXT,
+    size INTEGER
+);
+"""
+
+
+class CrawlState:
+    """SQLite-backed crawl frontier and page state.
+
+    The frontier holds every URL of the current crawl with its status, so an
+    interrupted crawl resumes with the pages that were still pending. Pages
+    keep their ETag/Last-Modified validators, a hash of the saved content and
+    their outgoing links across crawls, which lets a re-crawl use conditional
+    requests and leave unchanged files alone. Linked documents are tracked
+    the same way, so downloads still pending at an interruption are resumed
+    and failed ones are retried on the next crawl.
+
+    Writes are committed every `checkpoint_every` changes and on `close`.
+    """
+
+    def __init__(self, path, checkpoint_every=50):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_every = checkpoint_every
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.changes = 0
+        self.seq = 0
+
+    def get_meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        self._changed()
+
+    def start(self, base_url, resume=True):
+        """Begin a crawl of base_url.
+
+        Returns (visited urls, pending urls). Both are empty unless an
+        unfinished crawl of the same base URL is being resumed.
+        """
+        unfinished = self.get_meta("status") == "running" and self.get_meta("base_url") == base_url
+        if not (resume and unfinished):
+            self.conn.execute("DELETE FROM frontier")
+            self.set_meta("base_url", base_url)
+            self.set_meta("status", "running")
+            self.checkpoint()
+            return set(), []
+
+        rows = self.conn.execute("SELECT url, status FROM frontier ORDER BY seq").fetchall()
+        self.seq = len(rows)
+        visited = {url for url, _ in rows}
+        pending = [url for url, status in rows if status == "pending"]
+        print(f"Resuming crawl: {len(visited) - len(pending)} pages done, {len(pending)} pending")
+        return visited, pending
+
+    def finish(self):
+        self.set_meta("status", "finished")
+        self.checkpoint()
+
+    def add(self, url, status="pending"):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO frontier (url, status, seq) VALUES (?, ?, ?)", (url, status, self.seq)
+        )
+        self.seq += 1
+        self._changed()
+
+    def mark(self, url, status):
+        self.conn.execute("UPDATE frontier SET status = ? WHERE url = ?", (status, url))
+        self._changed()
+
+    def page(self, url):
+        """Stored state of a page as a dict, or None if it was never fetched"""
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_hash, links FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, content_hash, links = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "links": json.loads(links) if links else [],
+        }
+
+    def save_page(self, url, etag, last_modified, content_hash, links):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages (url, etag, last_modified, content_hash, links, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_hash, json.dumps(sorted(links)), time.time())
+        )
+        self._changed()
+
+    def add_document(self, link):
+        self.conn.execute(
+            "INSERT OR IGNORE INTO documents (url, link, status) VALUES (?, ?, 'pending')",
+            (link["url"], json.dumps(link, ensure_ascii=False))
+        )
+        self._changed()
+
+    def save_document(self, url, status, path=None, content_hash=None, size=None):
+        self.conn.execute(
+            "UPDATE documents SET status = ?, path = COALESCE(?, path), "
+            "content_hash = COALESCE(?, content_hash), size = COALESCE(?, size) WHERE url = ?",
+            (status, path, content_hash, size, url)
+        )
+        self._changed()
+
+    def pending_documents(self):
+        """Documents to (re)try: unfinished or failed in an earlier crawl. Their
+        pages may well come back unchanged, so nothing else would requeue them."""
+        rows = self.conn.execute(
+            "SELECT link FROM documents WHERE status IN ('pending', 'failed')"
+        ).fetchall()
+        return [json.loads(link) for link, in rows]
+
+    def stored_documents(self):
+        """{url: (path, content hash)} of documents already on disk"""
+        rows = self.conn.execute(
+            "SELECT url, path, content_hash FROM documents WHERE path IS NOT NULL"
+        ).fetchall()
+        return {url: (path, content_hash) for url, path, content_hash in rows}
+
+    def _changed(self):
+        self.changes += 1
+        if self.changes >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.conn.commit()
+        self.changes = 0
+
+    def close(self):
+        self.checkpoint()
+        self.conn.close()
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def file_digest(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DocumentDownloader:
+    """Stream linked documents to disk with a shared requests session.
+
+    Each download goes to a hidden per-URL .part file that is renamed into
+    place once complete, so readers never see half-written files. An
+    interrupted .part is resumed with a Range request, conditional on the
+    validators stored beside it (If-Range), so a document that changed in
+    the meantime is downloaded again rather than spliced. Files are
+    deduplicated by URL and by the SHA-256 of their content: a document
+    that is byte-identical to one already on disk is not stored twice, and
+    two different documents with the same anchor text get distinct names.
+
+    `download` is safe to call from several threads at once.
+    """
+
+    def __init__(self, session, directory="downloaded_files", chunk_size=1 << 16, known=None):
+        self.session = session
+        self.directory = Path(directory)
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self.urls = {}    # url -> path
+        self.hashes = {}  # content hash -> path
+        for url, (path, content_hash) in (known or {}).items():
+            self.urls[url] = Path(path)
+            if content_hash:
+                self.hashes[content_hash] = Path(path)
+
+    def target_path(self, link):
+        # Clean filename
+        clean_filename = "".join(c for c in link['text'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        return self.directory / link['type'] / f"{clean_filename or 'document'}.{link['type']}"
+
+    def download(self, link):
+        """Download one {'text', 'url', 'type'} link.
+
+        Returns a dict with the url, status ("downloaded", "duplicate" or
+        "skipped"), path, content hash and size.
+        """
+        url = link['url']
+        with self.lock:
+            known_path = self.urls.get(url)
+        if known_path is not None and known_path.exists():
+            print(f"• Skipped (already downloaded): {known_path}")
+            return {"url": url, "status": "skipped", "path": str(known_path),
+                    "content_hash": None, "size": known_path.stat().st_size}
+
+        file_dir = self.directory / link['type']
+        file_dir.mkdir(parents=True, exist_ok=True)
+        part_path = file_dir / f".{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.part"
+        content_hash, size = self.fetch(url, part_path)
+
+        with self.lock:
+            path = self.hashes.get(content_hash)
+            if path is not None and path.exists():
+                part_path.unlink()
+                status = "duplicate"
+                print(f"• Duplicate of {path}: {url}")
+            else:
+                path = self.target_path(link)
+                if path.exists() and file_digest(path) == content_hash:
+                    part_path.unlink()
+                    status = "duplicate"
+                elif path.exists():
+                    # Same anchor text, different document: keep both
+                    suffix = hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]
+                    path = path.with_name(f"{path.stem}-{suffix}{path.suffix}")
+                    os.replace(part_path, path)
+                    status = "downloaded"
+                else:
+                    os.replace(part_path, path)
+                    status = "downloaded"
+                if status == "downloaded":
+                    print(f"✓ Saved to: {path}")
+            self.urls[url] = path
+            self.hashes[content_hash] = path
+        return {"url": url, "status": status, "path": str(path), "content_hash": content_hash, "size": size}
+
+    def fetch(self, url, part_path):
+        """Stream url into part_path, resuming a previous partial download.
+        Returns (sha256 hex digest, size)."""
+        digest = hashlib.sha256()
+        validators_path = part_path.with_suffix(".validators")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        if_range = self.if_range(validators_path) if offset else None
+        # Without a validator a resumed range could come from a newer file
+        headers = {"Range": f"bytes={offset}-", "If-Range": if_range} if if_range else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=30) as response:
+            if response.status_code == 416 and headers:
+                # Nothing left to fetch or a stale range: start over
+                part_path.unlink()
+                validators_path.unlink(missing_ok=True)
+                return self.fetch(url, part_path)
+            response.raise_for_status()
+            if headers and response.status_code == 206:
+                print(f"Resuming download at {offset} bytes: {url}")
+                with open(part_path, "rb") as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+                mode = "ab"
+            else:
+                # Fresh download, or If-Range did not match and the server sent it whole
+                offset, mode = 0, "wb"
+                validators_path.write_text(json.dumps({
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                }), encoding="utf-8")
+            size = offset
+            with open(part_path, mode) as f:
+                for block in response.iter_content(self.chunk_size):
+                    f.write(block)
+                    digest.update(block)
+                    size += len(block)
+        validators_path.unlink(missing_ok=True)
+        return digest.hexdigest(), size
+
+    @staticmethod
+    def if_range(validators_path):
+        """If-Range value for resuming: a strong ETag, else Last-Modified"""
+        try:
+            validators = json.loads(validators_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        etag = validators.get("etag")
+        if etag and not etag.startswith("W/"):
+            return etag  # weak ETags are not allowed in If-Range
+        return validators.get("last_modified")
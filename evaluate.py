@@ -0,0 +1,193 @@
+"""Replay a question/answer dataset through RAGChatbot and report accuracy
+and latency.
+
+Usage:
+    python evaluate.py eval/sample_qa.jsonl -c 4 -o results.json
+    python evaluate.py eval/sample_qa.jsonl --tiny --compare results.json
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from prompts import eval_expert_prompt
+from rag_chatbot import EMBEDDING_MODEL, MODEL_NAME, RAGChatbot
+from stage_timer import StageTimer
+
+# Small public models that run on a CPU-only box, for CI. tiny-gpt2 has
+# 1024 positions, so context and answers are kept well inside that.
+TINY_MODEL = "sshleifer/tiny-gpt2"
+TINY_EMBEDDING_MODEL = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+TINY_CONTEXT_TOKENS = 256
+TINY_MAX_NEW_TOKENS = 64
+GRADE_PREFIX = f"<s>[INST] {eval_expert_prompt}\n"
+
+
+def load_dataset(path):
+    """Read a .jsonl or .json list of {"question", "answer"} records"""
+    text = Path(path).read_text(encoding="utf-8")
+    if path.endswith(".jsonl"):
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = json.loads(text)
+    for item in items:
+        if "question" not in item or "answer" not in item:
+            raise ValueError(f"Dataset record without question/answer: {item}")
+    return items
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = (len(values) - 1) * q / 100
+    low, high = int(index), min(int(index) + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (index - low)
+
+
+def grade(chatbot, question, answer, predicted):
+    """Ask the model whether the prediction matches the reference answer"""
+    prompt = (
+        f"{GRADE_PREFIX}QUESTION: {question}\nANSWER: {answer}\n"
+        f"PREDICTED: {predicted} [/INST]"
+    )
+    verdict = chatbot.generate(prompt, max_new_tokens=4)
+    return verdict.strip().lower().startswith("correct")
+
+
+def run_item(chatbot, item, should_grade):
+    with StageTimer() as timer:
+        start = time.perf_counter()
+        try:
+            predicted, sources, _ = chatbot.get_response(item["question"])
+            error = None
+        except Exception as e:
+            predicted, sources, error = "", [], str(e)
+        latency = time.perf_counter() - start
+    result = {
+        "question": item["question"],
+        "answer": item["answer"],
+        "predicted": predicted,
+        "sources": sources,
+        "latency": latency,
+        "stages": timer.stages,
+        "error": error,
+    }
+    if should_grade and error is None:
+        result["correct"] = grade(chatbot, item["question"], item["answer"], predicted)
+    return result
+
+
+def summarize(results, wall_seconds):
+    latencies = [r["latency"] for r in results if r["error"] is None]
+    graded = [r["correct"] for r in results if "correct" in r]
+    stages = {}
+    for r in results:
+        for name, seconds in r["stages"].items():
+            stages.setdefault(name, []).append(seconds)
+    return {
+        "questions": len(results),
+        "errors": sum(r["error"] is not None for r in results),
+        "accuracy": sum(graded) / len(graded) if graded else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "latency_mean": sum(latencies) / len(latencies) if latencies else 0.0,
+        "throughput_qps": len(results) / wall_seconds if wall_seconds else 0.0,
+        "wall_seconds": wall_seconds,
+        "stage_mean_seconds": {name: sum(v) / len(results) for name, v in sorted(stages.items())},
+    }
+
+
+def print_summary(summary, baseline=None):
+    def row(name, value, old=None):
+        if value is None:
+            text = "n/a"
+        else:
+            text = f"{value:.4f}"
+        if old is not None and value is not None:
+            text += f"  ({value - old:+.4f} vs baseline {old:.4f})"
+        print(f"  {name:<22} {text}")
+
+    base = baseline or {}
+    print("Summary:")
+    for key in ("accuracy", "latency_p50", "latency_p95", "latency_p99", "latency_mean", "throughput_qps"):
+        row(key, summary[key], base.get(key))
+    print(f"  {'errors':<22} {summary['errors']}/{summary['questions']}")
+    print("Mean seconds per stage:")
+    base_stages = base.get("stage_mean_seconds", {})
+    for name, seconds in summary["stage_mean_seconds"].items():
+        row(name, seconds, base_stages.get(name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline accuracy and latency evaluation")
+    parser.add_argument("dataset", help="JSON/JSONL file of {question, answer} records")
+    parser.add_argument("-c", "--concurrency", type=int, default=1)
+    parser.add_argument("-o", "--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    parser.add_argument("--limit", type=int, help="Only evaluate the first N questions")
+    parser.add_argument("--no-grade", action="store_true", help="Skip Correct/Incorrect grading")
+    parser.add_argument("--docs", default="./docs", help="Documents directory")
+    parser.add_argument("--model", help=f"Generation model (default {MODEL_NAME})")
+    parser.add_argument("--embedding-model", help=f"Embedding model (default {EMBEDDING_MODEL})")
+    parser.add_argument("--vector-store", help="Vector store directory (default vector_store)")
+    parser.add_argument("--tiny", action="store_true",
+                        help="Use small CPU stand-in models and a separate vector store")
+    args = parser.parse_args()
+
+    items = load_dataset(args.dataset)[:args.limit]
+    if args.tiny:
+        model = args.model or TINY_MODEL
+        embedding_model = args.embedding_model or TINY_EMBEDDING_MODEL
+        vector_store = args.vector_store or "vector_store_tiny"
+        limits = {"context_tokens": TINY_CONTEXT_TOKENS, "max_new_tokens": TINY_MAX_NEW_TOKENS}
+    else:
+        model = args.model or MODEL_NAME
+        embedding_model = args.embedding_model or EMBEDDING_MODEL
+        vector_store = args.vector_store or "vector_store"
+        limits = {}
+
+    chatbot = RAGChatbot(
+        docs_dir=args.docs,
+        model_name=model,
+        embedding_model=embedding_model,
+        vector_store_dir=vector_store,
+        **limits
+    )
+    if not args.no_grade:
+        chatbot.register_prefix(GRADE_PREFIX)
+
+    print(f"Evaluating {len(items)} questions at concurrency {args.concurrency}...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(lambda item: run_item(chatbot, item, not args.no_grade), items))
+    summary = summarize(results, time.perf_counter() - start)
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))["summary"]
+    print_summary(summary, baseline)
+
+    if args.output:
+        report = {
+            "config": {
+                "dataset": args.dataset,
+                "concurrency": args.concurrency,
+                "model": model,
+                "embedding_model": embedding_model,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "summary": summary,
+            "items": results,
+        }
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"Results saved to: {args.output}")
+    if summary["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,231 @@
 import pandas as pd
 import argparse
+import hashlib
+import json
+import multiprocessing
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import reduce
 from pathlib import Path
+from openpyxl import load_workbook
+
+# Rows per write; keeps memory flat however long the sheet is
+CHUNK_ROWS = 5000
+EXCEL_EXTENSIONS = ('.xlsx', '.xls', '.xlsm')
+MANIFEST_FILE = ".excel_manifest.json"
+
+
+def escape_cell(value):
+    """Format one cell for a Markdown table row"""
+    if value is None:
+        return ""
+    text = str(value)
+    return text.replace("|", "\\|").replace("\r\n", "<br>").replace("\n", "<br>").replace("\r", "<br>")
+
+
+def escape_column(column):
+    """Vectorized escape_cell for a pandas Series"""
+    return (column.astype(object).where(column.notna(), "").astype(str)
+            .str.replace("|", "\\|", regex=False)
+            .str.replace(r"\r\n|\n|\r", "<br>", regex=True))
+
+
+def table_header(columns):
+    columns = list(columns)
+    headers = "|" + "|".join(escape_cell(col) for col in columns) + "|"
+    separator = "|" + "|".join("---" for _ in columns) + "|"
+    return headers + "\n" + separator + "\n"
+
+
+def open_workbook(input_file):
+    """Open a workbook once for all its sheets: openpyxl in read-only mode
+    for .xlsx/.xlsm, a parsed pandas ExcelFile for formats openpyxl cannot
+    stream (.xls)"""
+    if Path(input_file).suffix.lower() in ('.xlsx', '.xlsm'):
+        return load_workbook(input_file, read_only=True, data_only=True)
+    return pd.ExcelFile(input_file)
+
+
+def iter_openpyxl(workbook, sheet_name=0, chunk_rows=CHUNK_ROWS):
+    """Stream a sheet of a read-only openpyxl workbook as Markdown text blocks"""
+    sheet = workbook.worksheets[sheet_name] if isinstance(sheet_name, int) else workbook[sheet_name]
+    rows = sheet.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    width = len(header)
+    yield table_header(f"Unnamed: {i}" if col is None else col for i, col in enumerate(header))
+
+    lines = []
+    for row in rows:
+        if all(cell is None for cell in row):
+            continue
+        cells = [escape_cell(cell) for cell in row[:width]]
+        cells += [""] * (width - len(cells))
+        lines.append("|" + "|".join(cells) + "|\n")
+        if len(lines) >= chunk_rows:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def iter_pandas(excel_file, sheet_name=0, chunk_rows=CHUNK_ROWS):
+    """Markdown text blocks for a sheet of a pandas ExcelFile, formatted
+    with column-wise string operations"""
+    df = excel_file.parse(sheet_name=sheet_name)
+    yield table_header(df.columns)
+    if df.empty:
+        return
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        columns = [escape_column(chunk[col]) for col in chunk.columns]
+        lines = reduce(lambda line, column: line + "|" + column, columns[1:], "|" + columns[0]) + "|"
+        yield "\n".join(lines) + "\n"
+
+
+def iter_markdown(input_file, sheet_name=0, chunk_rows=CHUNK_ROWS, title=None, workbook=None):
+    """Yield the Markdown for one sheet in blocks, title first. Pass the
+    open_workbook() result as `workbook` to read several sheets from one
+    opened file."""
+    yield f"# {title or Path(input_file).stem}\n\n"
+    opened = workbook is None
+    if opened:
+        workbook = open_workbook(input_file)
+    try:
+        if isinstance(workbook, pd.ExcelFile):
+            yield from iter_pandas(workbook, sheet_name, chunk_rows)
+        else:
+            yield from iter_openpyxl(workbook, sheet_name, chunk_rows)
+    finally:
+        if opened:
+            workbook.close()
+
+
+def sheet_names(workbook):
+    if isinstance(workbook, pd.ExcelFile):
+        return workbook.sheet_names
+    return workbook.sheetnames
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def convert_workbook(input_file, output_file, previous_hash=None):
+    """Convert every sheet of a workbook into one Markdown file.
+
+    Runs in a worker process. Returns (digest, number of sheets, seconds);
+    the number of sheets is None when the content hash equals
+    `previous_hash` and nothing was written.
+    """
+    start = time.perf_counter()
+    digest = file_hash(input_file)
+    if digest == previous_hash and Path(output_file).exists():
+        return digest, None, time.perf_counter() - start
+
+    stem = Path(input_file).stem
+    output_file = Path(output_file)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    # Write beside the target and rename, so ingestion never reads a partial file
+    tmp_file = output_file.with_name(output_file.name + ".tmp")
+    workbook = open_workbook(input_file)
+    try:
+        names = sheet_names(workbook)
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for i, name in enumerate(names):
+                if i:
+                    f.write("\n")
+                title = stem if len(names) == 1 else f"{stem} - {name}"
+                for block in iter_markdown(input_file, name, title=title, workbook=workbook):
+                    f.write(block)
+    finally:
+        workbook.close()
+    os.replace(tmp_file, output_file)
+    return digest, len(names), time.perf_counter() - start
+
+
+def convert_directory(input_dir, output_dir="docs", workers=0, force=False):
+    """Convert every workbook under input_dir into output_dir as .txt files.
+
+    The directory layout is mirrored and a manifest in output_dir records
+    each source's mtime, size and hash: files whose mtime and size are
+    unchanged are skipped without being opened, and files that were only
+    touched are skipped after hashing. Outputs of workbooks that no longer
+    exist are removed.
+    """
+    input_dir, output_dir = Path(input_dir), Path(output_dir)
+    manifest_path = output_dir / MANIFEST_FILE
+    manifest = {}
+    if manifest_path.exists() and not force:
+        manifest = json.loads(manifest_path.read_text(encoding='utf-8'))
+
+    files = sorted(
+        path for path in input_dir.rglob("*")
+        if path.suffix.lower() in EXCEL_EXTENSIONS and not path.name.startswith("~$")
+    )
+    jobs, new_manifest = {}, {}
+    for path in files:
+        key = path.relative_to(input_dir).as_posix()
+        stat = path.stat()
+        entry = manifest.get(key)
+        output_file = output_dir / f"{key}.txt"
+        if entry and entry["mtime"] == stat.st_mtime and entry["size"] == stat.st_size \
+                and output_file.exists():
+            new_manifest[key] = entry
+        else:
+            jobs[key] = (path, output_file, entry["hash"] if entry else None, stat)
+
+    for key, entry in manifest.items():
+        if key not in new_manifest and key not in jobs:
+            (output_dir / entry["output"]).unlink(missing_ok=True)
+            print(f"Removed {entry['output']} (source deleted)")
+
+    print(f"{len(files)} workbooks: {len(new_manifest)} unchanged, {len(jobs)} to check")
+    start = time.perf_counter()
+    converted = failed = 0
+    if jobs:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context) as executor:
+            futures = {
+                executor.submit(convert_workbook, str(path), str(output_file), previous_hash): key
+                for key, (path, output_file, previous_hash, _) in jobs.items()
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                path, output_file, _, stat = jobs[key]
+                try:
+                    digest, num_sheets, seconds = future.result()
+                except Exception as e:
+                    print(f"✗ {key}: {e}", file=sys.stderr)
+                    failed += 1
+                    continue
+                new_manifest[key] = {
+                    "mtime": stat.st_mtime,
+                    "size": stat.st_size,
+                    "hash": digest,
+                    "output": output_file.relative_to(output_dir).as_posix()
+                }
+                if num_sheets is None:
+                    print(f"• {key}: content unchanged ({seconds:.2f}s)")
+                else:
+                    converted += 1
+                    print(f"✓ {key}: {num_sheets} sheet(s) in {seconds:.2f}s")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(new_manifest, indent=2), encoding='utf-8')
+    os.replace(tmp_path, manifest_path)
+    print(f"Converted {converted} workbooks in {time.perf_counter() - start:.1f}s "
+          f"({failed} failed) into {output_dir}")
+    return converted, failed
+
 
 def excel_to_markdown(input_file, output_file=None, sheet_name=0):
     """
@@ -13,32 +237,15 @@ def excel_to_markdown(input_file, output_file=None, sheet_name=0):
         sheet_name (str/int, optional): Sheet name or index to convert. Defaults to 0 (first sheet)
     """
     try:
-        # Read Excel file
-        df = pd.read_excel(input_file, sheet_name=sheet_name)
-
-        # Convert DataFrame to Markdown
-        # Get the filename without extension
-        filename = Path(input_file).stem
-        markdown = f"# {filename}\n\n"
-
-        # Add table headers
-        headers = "|" + "|".join(str(col) for col in df.columns) + "|"
-        separator = "|" + "|".join("---" for _ in df.columns) + "|"
-
-        markdown += headers + "\n"
-        markdown += separator + "\n"
-
-        # Add table rows
-        for _, row in df.iterrows():
-            markdown += "|" + "|".join(str(cell) for cell in row) + "|\n"
-
         # Output handling
         if output_file:
             with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(markdown)
+                for block in iter_markdown(input_file, sheet_name):
+                    f.write(block)
             print(f"Conversion complete. Output saved to: {output_file}")
         else:
-            print(markdown)
+            for block in iter_markdown(input_file, sheet_name):
+                sys.stdout.write(block)
 
     except Exception as e:
         print(f"Error: {str(e)}", file=sys.stderr)
@@ -47,9 +254,13 @@ def excel_to_markdown(input_file, output_file=None, sheet_name=0):
 def main():
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Convert Excel file to Markdown format')
-    parser.add_argument('input_file', help='Path to input Excel file')
-    parser.add_argument('-o', '--output', help='Path to output Markdown file (optional)')
+    parser.add_argument('input_file', help='Path to input Excel file, or a directory to convert every workbook in')
+    parser.add_argument('-o', '--output', help='Path to output Markdown file (optional); '
+                                               'for a directory, the output directory (default: docs)')
     parser.add_argument('-s', '--sheet', help='Sheet name or index (default: 0)', default=0)
+    parser.add_argument('-w', '--workers', type=int, default=0,
+                        help='Processes for directory mode (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Ignore the manifest and reconvert everything')
 
     # Parse arguments
     args = parser.parse_args()
@@ -60,6 +271,11 @@ def main():
         print(f"Error: Input file '{args.input_file}' does not exist", file=sys.stderr)
         sys.exit(1)
 
+    # Directory mode: every sheet of every workbook
+    if input_path.is_dir():
+        _, failed = convert_directory(input_path, args.output or "docs", args.workers, args.force)
+        sys.exit(1 if failed else 0)
+
     # Validate file extension
     if input_path.suffix.lower() not in ['.xlsx', '.xls', '.xlsm']:
         print("Error: Input file must be an Excel file (.xlsx, .xls, or .xlsm)", file=sys.stderr)
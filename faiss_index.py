@@ -0,0 +1,156 @@
+import math
+import pickle
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+from langchain.vectorstores import FAISS
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def index_spec(kind, dim, num_vectors, nlist=0, pq_m=16, hnsw_m=32):
+    """Return the faiss.index_factory string for an index type, or "Flat"
+    when there are too few training vectors for it"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}, expected one of {INDEX_TYPES}")
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{hnsw_m}"
+
+    # faiss wants ~39 training points per centroid; PQ needs 256 per code book
+    nlist = nlist or int(4 * math.sqrt(num_vectors))
+    nlist = min(nlist, num_vectors // 39)
+    min_points = 256 if kind == "ivf_pq" else 39
+    if nlist < 1 or num_vectors < min_points:
+        print(f"Only {num_vectors} vectors, falling back to a flat index instead of {kind}")
+        return "Flat"
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if dim % pq_m:
+        raise ValueError(f"PQ sub-quantizers ({pq_m}) must divide the embedding size ({dim})")
+    return f"IVF{nlist},PQ{pq_m}"
+
+
+def build_index(kind, vectors, train_sample=100000, **params):
+    """Create an empty index of the given type, trained on a random sample"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    if num_vectors > train_sample:
+        rows = np.random.default_rng(0).choice(num_vectors, train_sample, replace=False)
+        sample = vectors[rows]
+    else:
+        sample = vectors
+    spec = index_spec(kind, dim, len(sample), **params)
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        print(f"Training {spec} index on {len(sample)} vectors...")
+        index.train(sample)
+    return index
+
+
+def tune_index(index, nprobe=None, ef_search=None):
+    """Apply query-time search parameters where the index type supports them"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = nprobe
+    if ef_search and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def add_chunks(store, texts, vectors, metadatas, ids):
+    """Add embedded chunks under labels following the highest one in use.
+
+    Used instead of FAISS.add_embeddings, which numbers new vectors from
+    len(index_to_docstore_id); after remove_chunks on an IVF index labels
+    have gaps and that number may already be taken.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if getattr(store, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+    start = max(store.index_to_docstore_id, default=-1) + 1
+    labels = np.arange(start, start + len(vectors), dtype=np.int64)
+    if faiss.try_extract_index_ivf(store.index) is not None:
+        store.index.add_with_ids(vectors, labels)
+    else:
+        store.index.add(vectors)  # rows, and so labels, follow on from ntotal
+    store.docstore.add({
+        chunk_id: Document(page_content=text, metadata=metadata)
+        for chunk_id, text, metadata in zip(ids, texts, metadatas)
+    })
+    store.index_to_docstore_id.update(zip(labels.tolist(), ids))
+
+
+def remove_chunks(store, chunk_ids):
+    """Delete chunks from a store without re-embedding anything.
+
+    IVF indexes store each vector's label in its inverted list, so they
+    remove labels in place and the other labels keep their documents;
+    index_to_docstore_id then has gaps. A flat index compacts its rows, as
+    FAISS.delete expects. HNSW graphs cannot remove vectors, so the index is
+    rebuilt from the reconstructed vectors of the surviving chunks.
+    """
+    stale = set(chunk_ids)
+    labels = [label for label, chunk_id in store.index_to_docstore_id.items() if chunk_id in stale]
+    if not labels:
+        return
+    if isinstance(store.index, faiss.IndexFlat):
+        store.delete([store.index_to_docstore_id[label] for label in labels])
+        return
+    removed = [store.index_to_docstore_id[label] for label in labels]
+    if faiss.try_extract_index_ivf(store.index) is not None:
+        store.index.remove_ids(np.array(labels, dtype=np.int64))
+        for label in labels:
+            del store.index_to_docstore_id[label]
+    else:
+        keep = sorted(set(store.index_to_docstore_id) - set(labels))
+        store.index = rebuild(store.index, keep)
+        store.index_to_docstore_id = {row: store.index_to_docstore_id[label] for row, label in enumerate(keep)}
+    store.docstore.delete(removed)
+
+
+def rebuild(index, rows, block=65536):
+    """An index of the same type and parameters holding only the given rows
+    (labels 0..ntotal-1), re-added from their reconstructed vectors"""
+    print(f"Rebuilding the index from {len(rows)} of {index.ntotal} vectors...")
+    keep = np.zeros(index.ntotal, dtype=bool)
+    keep[rows] = True
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    for start in range(0, index.ntotal, block):
+        vectors = index.reconstruct_n(start, min(block, index.ntotal - start))
+        rebuilt.add(vectors[keep[start:start + len(vectors)]])
+    return rebuilt
+
+
+def create_store(embeddings, index):
+    """Wrap an empty faiss index in a LangChain FAISS vector store"""
+    return FAISS(embeddings, index, InMemoryDocstore({}), {})
+
+
+def load_store(folder, embeddings, mmap=False):
+    """Load a store written by FAISS.save_local, optionally memory-mapping
+    the index read-only so processes share its pages.
+
+    faiss only maps the inverted lists of IVF indexes; flat and HNSW
+    indexes are read into memory whatever `mmap` says, and index.pkl (the
+    docstore) is always unpickled in full.
+    """
+    folder = Path(folder)
+    index_path = str(folder / "index.faiss")
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError as e:
+            print(f"Could not memory-map {index_path} ({e}), reading it into memory")
+    if index is None:
+        index = faiss.read_index(index_path)
+    elif faiss.try_extract_index_ivf(index) is None:
+        print(f"Memory-mapping only applies to IVF indexes, {index_path} was read into memory")
+    with open(folder / "index.pkl", "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
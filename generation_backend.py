@@ -0,0 +1,426 @@
+import copy
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Thread
+
+import requests
+import torch
+from huggingface_hub import login, try_to_load_from_cache
+from requests.adapters import HTTPAdapter
+from transformers import (AutoModelForCausalLM, AutoTokenizer, LogitsProcessor, LogitsProcessorList,
+                          TextIteratorStreamer)
+
+from config import get_token
+from stage_timer import StageTimer, count, merge, record, stage
+
+
+def model_cached(model_name, model_dir=None):
+    """True when the model's files are already in the local Hub cache"""
+    cached = try_to_load_from_cache(
+        model_name,
+        "config.json",
+        cache_dir=str(model_dir) if model_dir else None
+    )
+    return isinstance(cached, str)
+
+
+def hub_login():
+    try:
+        login(token=get_token())
+    except ValueError as e:
+        # Public models (e.g. small stand-ins for CI) load without a token
+        print(f"{e} Continuing without Hugging Face login.")
+
+
+def from_hub(load, model_name, model_dir=None):
+    """Call load(local_files_only) for a Hub model, skipping the login and
+    Hub round trips when its files are cached locally"""
+    if model_cached(model_name, model_dir):
+        print(f"{model_name} found in local cache, skipping Hugging Face login")
+        try:
+            return load(True)
+        except OSError as e:
+            print(f"Local cache of {model_name} is incomplete ({e}), downloading")
+    hub_login()
+    return load(False)
+
+
+def load_tokenizer(model_name, model_dir=None, local_files_only=False):
+    tokenizer = AutoTokenizer.from_pretrained(
+        model_name,
+        trust_remote_code=True,
+        cache_dir=model_dir,
+        local_files_only=local_files_only
+    )
+    # Batched generation pads prompts on the left
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+
+class FirstTokenTimer(LogitsProcessor):
+    """Leaves scores untouched; notes when the prefill pass has finished,
+    which is the first time generate() asks for logits processing"""
+
+    def __init__(self):
+        self.first = None
+
+    def __call__(self, input_ids, scores):
+        if self.first is None:
+            self.first = time.perf_counter()
+        return scores
+
+
+class PrefixCache:
+    """Past key/values for registered prompt prefixes, so their prefill runs
+    once instead of on every request.
+
+    A prefix is prefilled on first use and every request starts from a
+    copy of its key/values, since generate() extends the cache it is given.
+    Prefixes are cut back to their last line break, where most tokenizers
+    split a prompt; the backend still checks each prompt's ids before using
+    the cache. At most `max_tokens` prefix tokens are kept.
+    """
+
+    def __init__(self, model, tokenizer, max_tokens=16384):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.entries = {}  # prefix text -> None (not prefilled yet), False (over budget) or (ids, past)
+        self.cached_tokens = 0
+        self.lock = threading.Lock()
+
+    def register(self, text):
+        cut = text.rfind("\n")
+        if cut < 0:
+            return
+        with self.lock:
+            self.entries.setdefault(text[:cut + 1], None)
+
+    def match(self, prompts):
+        """Longest registered prefix that all prompts start with"""
+        with self.lock:
+            prefixes = [text for text, entry in self.entries.items() if entry is not False]
+        matches = [text for text in prefixes if all(prompt.startswith(text) for prompt in prompts)]
+        return max(matches, key=len) if matches else None
+
+    def get(self, text):
+        """(prefix ids, past key/values) for a registered prefix, or None"""
+        with self.lock:
+            entry = self.entries.get(text)
+            if entry is None:
+                entry = self.entries[text] = self.prefill(text)
+            return entry or None
+
+    def prefill(self, text):
+        ids = self.tokenizer(text, return_tensors="pt", add_special_tokens=False)["input_ids"]
+        if self.cached_tokens + ids.shape[1] > self.max_tokens:
+            print(f"Prefix cache full, not caching a {ids.shape[1]}-token prefix")
+            return False
+        ids = ids.to(self.model.device)
+        with stage("prefix_prefill"), torch.no_grad():
+            past = self.model(input_ids=ids, use_cache=True).past_key_values
+        self.cached_tokens += ids.shape[1]
+        print(f"Cached key/values for a {ids.shape[1]}-token prompt prefix")
+        return ids, past
+
+    def copy(self, past, batch_size):
+        """The cached key/values for every row of a batch, safe to extend"""
+        if isinstance(past, tuple):
+            # Legacy tuple caches are extended into new tensors, never in place
+            return tuple(tuple(tensor.expand(batch_size, *tensor.shape[1:]) for tensor in layer)
+                         for layer in past)
+        past = copy.deepcopy(past)
+        if batch_size > 1:
+            past.batch_repeat_interleave(batch_size)
+        return past
+
+
+class TransformersBackend:
+    """Generate in-process with a Hugging Face causal LM.
+
+    All methods return only the newly generated text. Tokenization,
+    prefill and decoding are reported as separate stages, and prompt and
+    completion token counts through stage_timer.count. Prompts starting
+    with a prefix given to `register_prefix` reuse its cached key/values
+    unless `prefix_cache` is False.
+    """
+
+    def __init__(self, model_name, model_dir=None, max_new_tokens=512, temperature=0.7,
+                 prefix_cache=True, prefix_cache_tokens=16384):
+        self.model_name = model_name
+        self.model_dir = Path(model_dir) if model_dir else None
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        from_hub(self.load, model_name, self.model_dir)
+        self.prefixes = PrefixCache(self.model, self.tokenizer, prefix_cache_tokens) if prefix_cache else None
+
+    def load(self, local_files_only):
+        self.tokenizer = load_tokenizer(self.model_name, self.model_dir, local_files_only)
+        self.model = AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            device_map="auto",
+            trust_remote_code=True,
+            cache_dir=self.model_dir,
+            local_files_only=local_files_only
+        )
+
+    def register_prefix(self, text):
+        """Cache the key/values of a fixed prompt prefix on first use"""
+        if self.prefixes is not None:
+            self.prefixes.register(text)
+
+    def tokenize(self, prompts):
+        with stage("tokenize"):
+            # Prompts carry their own <s>, as with the text-generation pipeline
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False)
+        count("prompt_tokens", int(inputs["attention_mask"].sum()))
+        inputs = inputs.to(self.model.device)
+        prefix = self.prefixes.match(prompts) if self.prefixes is not None else None
+        cached = self.prefixes.get(prefix) if prefix else None
+        return self.with_prefix(inputs, cached) if cached is not None else inputs
+
+    def with_prefix(self, inputs, cached):
+        """Inputs that continue from the cached prefix key/values, or the
+        uncached inputs unless every prompt's ids start with the prefix ids.
+
+        Tokenizers need not split a prompt at the prefix boundary; a
+        SentencePiece tokenizer, for one, merges across it or marks the start
+        of the rest with "▁". The prefix ids are cut out of each row after
+        its left padding, so the padding then sits between prefix and rest,
+        masked out, and position ids follow the attention mask.
+        """
+        prefix_ids, past = cached
+        prefix_ids = prefix_ids[0]
+        prefix_length = len(prefix_ids)
+        ids, mask = inputs["input_ids"], inputs["attention_mask"]
+        padding = (ids.shape[1] - mask.sum(dim=1)).tolist()
+        for row, start in enumerate(padding):
+            row_ids = ids[row, start:]
+            if len(row_ids) <= prefix_length or not torch.equal(row_ids[:prefix_length], prefix_ids):
+                return inputs
+
+        def cut(tensor, row, start):
+            return torch.cat([tensor[row, :start], tensor[row, start + prefix_length:]])
+
+        batch_size = ids.shape[0]
+        count("cached_prompt_tokens", batch_size * prefix_length)
+        return {
+            "input_ids": torch.cat([
+                prefix_ids.expand(batch_size, -1),
+                torch.stack([cut(ids, row, start) for row, start in enumerate(padding)])
+            ], dim=1),
+            "attention_mask": torch.cat([
+                torch.ones(batch_size, prefix_length, dtype=mask.dtype, device=mask.device),
+                torch.stack([cut(mask, row, start) for row, start in enumerate(padding)])
+            ], dim=1),
+            "past_key_values": self.prefixes.copy(past, batch_size),
+        }
+
+    def generation_kwargs(self, inputs, max_new_tokens):
+        """generate() arguments, with max_new_tokens cut to the positions the
+        model has left after the prompt (small models have as few as 1024)"""
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        window = getattr(self.model.config, "max_position_embeddings", None)
+        if window:
+            prompt_length = inputs["input_ids"].shape[1]
+            if prompt_length >= window:
+                raise ValueError(f"Prompt of {prompt_length} tokens does not fit the model's {window} positions")
+            max_new_tokens = min(max_new_tokens, window - prompt_length)
+        return {
+            "max_new_tokens": max_new_tokens,
+            "temperature": self.temperature,
+            "pad_token_id": self.tokenizer.pad_token_id,
+        }
+
+    def new_tokens(self, inputs, output):
+        """Strip the (left padded) prompt and count the completion tokens"""
+        new = output[:, inputs["input_ids"].shape[1]:]
+        count("completion_tokens", int((new != self.tokenizer.pad_token_id).sum()))
+        return new
+
+    def generate(self, prompt, max_new_tokens=None):
+        return self.generate_batch([prompt], max_new_tokens)[0]
+
+    def generate_batch(self, prompts, max_new_tokens=None):
+        """One padded generation batch for several prompts"""
+        inputs = self.tokenize(prompts)
+        timer = FirstTokenTimer()
+        start = time.perf_counter()
+        with torch.no_grad():
+            output = self.model.generate(
+                **inputs,
+                logits_processor=LogitsProcessorList([timer]),
+                **self.generation_kwargs(inputs, max_new_tokens)
+            )
+        end = time.perf_counter()
+        first = timer.first or end
+        record("prefill", first - start)
+        record("decode", end - first)
+        new = self.new_tokens(inputs, output)
+        return [text.strip() for text in self.tokenizer.batch_decode(new, skip_special_tokens=True)]
+
+    def stream(self, prompt, max_new_tokens=None):
+        """Yield text pieces as the model produces them"""
+        inputs = self.tokenize([prompt])
+        streamer = TextIteratorStreamer(
+            self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True
+        )
+        outputs, errors = [], []
+
+        def generate():
+            try:
+                with torch.no_grad():
+                    outputs.append(self.model.generate(
+                        **inputs, streamer=streamer, **self.generation_kwargs(inputs, max_new_tokens)
+                    ))
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        thread = Thread(target=generate, daemon=True)
+        start = time.perf_counter()
+        first = None
+        thread.start()
+        for text in streamer:
+            if first is None:
+                # Time to the first decoded text stands in for prefill here
+                first = time.perf_counter()
+                record("prefill", first - start)
+            if text:
+                yield text
+        thread.join()
+        if errors:
+            raise errors[0]
+        record("decode", time.perf_counter() - (first or start))
+        self.new_tokens(inputs, outputs[0])
+
+
+class HTTPBackend:
+    """Generate against a model server with an Ollama or OpenAI-compatible
+    completions API, so the model can be scaled apart from retrieval.
+
+    Prompts are sent verbatim (Ollama `raw` mode / OpenAI `/v1/completions`)
+    because they already carry the model's instruction format. A pooled
+    keep-alive session is shared by all threads and at most `concurrency`
+    requests are in flight; batches are spread over that many requests.
+    """
+
+    def __init__(self, base_url, model, api="ollama", concurrency=4, timeout=120, api_key=None,
+                 max_new_tokens=512, temperature=0.7):
+        if api not in ("ollama", "openai"):
+            raise ValueError(f"Unknown generation API {api!r}, expected 'ollama' or 'openai'")
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.api = api
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="llm-http")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def request(self, prompt, max_new_tokens, stream):
+        max_new_tokens = max_new_tokens or self.max_new_tokens
+        if self.api == "ollama":
+            return f"{self.base_url}/api/generate", {
+                "model": self.model,
+                "prompt": prompt,
+                "raw": True,
+                "stream": stream,
+                "options": {"num_predict": max_new_tokens, "temperature": self.temperature}
+            }
+        return f"{self.base_url}/v1/completions", {
+            "model": self.model,
+            "prompt": prompt,
+            "max_tokens": max_new_tokens,
+            "temperature": self.temperature,
+            "stream": stream
+        }
+
+    def generate(self, prompt, max_new_tokens=None):
+        url, body = self.request(prompt, max_new_tokens, stream=False)
+        with self.slots:
+            response = self.session.post(url, json=body, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        if "error" in data:
+            raise RuntimeError(f"Model server error: {data['error']}")
+        self.report(data)
+        text = data["response"] if self.api == "ollama" else data["choices"][0]["text"]
+        return text.strip()
+
+    def report(self, data):
+        """Pass on token counts, and Ollama's prefill/decode durations"""
+        if self.api == "ollama":
+            if "prompt_eval_count" in data:
+                count("prompt_tokens", data["prompt_eval_count"])
+            if "eval_count" in data:
+                count("completion_tokens", data["eval_count"])
+            if "prompt_eval_duration" in data:
+                record("prefill", data["prompt_eval_duration"] / 1e9)
+            if "eval_duration" in data:
+                record("decode", data["eval_duration"] / 1e9)
+        elif data.get("usage"):
+            count("prompt_tokens", data["usage"].get("prompt_tokens", 0))
+            count("completion_tokens", data["usage"].get("completion_tokens", 0))
+
+    def register_prefix(self, text):
+        """Nothing to do: model servers such as Ollama and vLLM reuse the
+        key/values of a repeated prompt prefix themselves"""
+
+    def generate_batch(self, prompts, max_new_tokens=None):
+        """Spread a batch over the pooled requests. Their stages and counts
+        are added to the caller's StageTimer: counts summed, and each stage
+        as long as its slowest request, since the requests overlap."""
+        def generate(prompt):
+            with StageTimer() as timer:
+                return self.generate(prompt, max_new_tokens), timer
+
+        results = list(self.executor.map(generate, prompts))
+        stages, counts = {}, {}
+        for _, timer in results:
+            for name, seconds in timer.stages.items():
+                stages[name] = max(stages.get(name, 0.0), seconds)
+            for name, amount in timer.counts.items():
+                counts[name] = counts.get(name, 0) + amount
+        merge(stages, counts)
+        return [text for text, _ in results]
+
+    def stream(self, prompt, max_new_tokens=None):
+        """Yield text pieces from the server's streaming response"""
+        url, body = self.request(prompt, max_new_tokens, stream=True)
+        with self.slots:
+            with self.session.post(url, json=body, stream=True, timeout=self.timeout) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    if self.api == "openai":
+                        if not line.startswith("data:"):
+                            continue
+                        line = line[len("data:"):].strip()
+                        if line == "[DONE]":
+                            return
+                    data = json.loads(line)
+                    if "error" in data:
+                        raise RuntimeError(f"Model server error: {data['error']}")
+                    text = data.get("response", "") if self.api == "ollama" else data["choices"][0]["text"]
+                    if text:
+                        yield text
+                    if data.get("done"):
+                        self.report(data)
+                        return
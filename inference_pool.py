@@ -0,0 +1,158 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+_current = threading.local()
+
+
+class QueueFullError(Exception):
+    """Raised when every worker is busy and the admission queue is full"""
+
+
+class QueueTimeoutError(asyncio.TimeoutError):
+    """Raised when a request timed out before a worker picked it up, so it never ran"""
+
+
+def timed_out():
+    """True once the caller of the pool job running in this thread has
+    given up waiting for it, so the job can report its outcome as a timeout"""
+    event = getattr(_current, "timed_out", None)
+    return event is not None and event.is_set()
+
+
+class InferencePool:
+    """Run blocking inference off the event loop with bounded admission.
+
+    At most `workers` calls run at once and at most `max_queue` more wait
+    for a worker; anything beyond that is rejected with QueueFullError so
+    the caller can answer 503 instead of piling up requests. A slot is only
+    released once its work has actually finished, so timed-out requests
+    still count against capacity while their generation runs.
+    """
+
+    def __init__(self, workers=1, max_queue=16, timeout=300):
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self.lock = threading.Lock()
+        self.admitted = 0  # queued + running
+        self.running = 0
+        self.avg_seconds = None  # moving average of service time
+
+    @property
+    def queue_depth(self):
+        return max(0, self.admitted - self.running)
+
+    def retry_after(self):
+        """Rough number of seconds until a slot frees up"""
+        per_request = self.avg_seconds or 1.0
+        return max(1, math.ceil(per_request * (self.queue_depth + 1) / self.workers))
+
+    def admit(self):
+        with self.lock:
+            if self.admitted >= self.capacity:
+                raise QueueFullError(
+                    f"Server busy: {self.admitted} requests in flight (limit {self.capacity})"
+                )
+            self.admitted += 1
+
+    def _release(self, _future):
+        with self.lock:
+            self.admitted -= 1
+
+    def _timed(self, timed_out_event, fn, *args):
+        with self.lock:
+            self.running += 1
+        _current.timed_out = timed_out_event
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            _current.timed_out = None
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.running -= 1
+                self.avg_seconds = elapsed if self.avg_seconds is None else 0.8 * self.avg_seconds + 0.2 * elapsed
+
+    def submit(self, fn, *args):
+        """Admit and schedule fn(*args), returning a concurrent Future"""
+        self.admit()
+        timed_out_event = threading.Event()
+        future = self.executor.submit(self._timed, timed_out_event, fn, *args)
+        future.timed_out = timed_out_event
+        future.add_done_callback(self._release)
+        return future
+
+    @staticmethod
+    def expired(future):
+        """Mark a job whose caller timed out and return the error to raise:
+        QueueTimeoutError if it was still queued (and is now cancelled)"""
+        future.timed_out.set()
+        return QueueTimeoutError() if future.cancel() else asyncio.TimeoutError()
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool; raises QueueFullError or asyncio.TimeoutError"""
+        future = self.submit(fn, *args)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                raise  # fn's own TimeoutError
+            raise self.expired(future) from None
+        finally:
+            future.cancel()  # no-op once started, frees the slot if still queued
+
+    def stream(self, fn, *args, timeout=None, stoppable=False):
+        """Admit a generator function and return an async iterator over its items.
+
+        Admission happens immediately so callers can still reject the request
+        before any response has been sent. `timeout` overrides the pool's
+        for long-running streams such as batch jobs. With `stoppable`, fn also
+        gets the event that is set once the consumer goes away, as its
+        `stopped` keyword argument, so it can skip work nobody will read.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stopped = threading.Event()
+        kwargs = {"stopped": stopped} if stoppable else {}
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (None, e))
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, (_DONE, None))
+
+        future = self.submit(produce)
+        return self._drain(loop, queue, stopped, future, timeout or self.timeout)
+
+    async def _drain(self, loop, queue, stopped, future, timeout):
+        deadline = loop.time() + timeout
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    item, error = await asyncio.wait_for(queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    raise self.expired(future) from None
+                if item is _DONE:
+                    break
+                if error is not None:
+                    raise error
+                yield item
+        finally:
+            stopped.set()
+            future.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
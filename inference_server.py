@@ -0,0 +1,472 @@
+"""The process shared by several chat_app API worker processes.
+
+Every API worker runs the whole request pipeline itself: embedding,
+FAISS/BM25 retrieval, reranking, tokenization and context packing, against
+the on-disk index that this process builds or updates at startup (IVF
+inverted lists are memory-mapped, so the workers share those pages). What
+cannot be copied per worker lives here and is reached over a Unix socket:
+
+  - the language model, when JUNCTION_GENERATION_BACKEND=transformers;
+    workers generate through RemoteBackend, and concurrent calls from all
+    of them are micro-batched together. With a model server backend the
+    workers call the model server directly.
+  - batch job progress, since a poll may reach another worker than the
+    one running the job
+  - metrics: workers push snapshots of theirs, and /metrics on any worker
+    renders the sum of all of them and this process's generation metrics
+
+    python inference_server.py --socket /tmp/junction.sock
+    JUNCTION_INFERENCE_SOCKET=/tmp/junction.sock uvicorn chat_app:app --workers 4
+
+`python chat_app.py` with JUNCTION_API_WORKERS > 1 starts both for you.
+"""
+import argparse
+import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+
+import config
+from batch_jobs import BatchJobStore
+from batch_scheduler import BatchScheduler
+from metrics import Metrics
+from rag_chatbot import RAGChatbot
+from reasoning_dag import ReasoningDAGExecutor
+from response_cache import ResponseCache
+from self_rag import SelfRAGPipeline
+from stage_timer import StageTimer, add_count_listener, add_listener, merge
+
+# Seconds between metrics pushes of a worker; a worker whose last push is
+# older than a few of these no longer counts towards the gauges
+METRICS_PUSH_SECONDS = 5
+
+
+class RemoteError(Exception):
+    """An exception raised by a call in the shared process"""
+
+
+def inference_workers():
+    """Concurrent generation calls: callers only wait on the batch
+    scheduler when micro-batching, so there must be enough to fill a batch"""
+    if config.BATCH_MAX_SIZE > 1:
+        return max(config.INFERENCE_WORKERS, config.BATCH_MAX_SIZE)
+    return config.INFERENCE_WORKERS
+
+
+def create_chatbot(client=None):
+    """RAGChatbot with the configured response cache; call warm_up() to load it.
+
+    With a `client` of the shared process the chatbot reads the index that
+    process maintains and, for the transformers backend, generates there.
+    """
+    cache = None
+    if config.RESPONSE_CACHE_ENTRIES > 0:
+        cache = ResponseCache(
+            max_entries=config.RESPONSE_CACHE_ENTRIES,
+            max_bytes=int(config.RESPONSE_CACHE_MB * 1024 * 1024),
+            ttl=config.RESPONSE_CACHE_TTL,
+            similarity_threshold=config.RESPONSE_CACHE_SIMILARITY or None
+        )
+    if client is None:
+        return RAGChatbot(cache=cache, lazy=True)
+    backend = RemoteBackend(client) if config.GENERATION_BACKEND == "transformers" else None
+    return RAGChatbot(cache=cache, lazy=True, backend=backend, update_index=False)
+
+
+def build_handlers(chatbot, batch=True):
+    """The question-answering entry points used by chat_app, by name"""
+    # Concurrent /chat requests can be merged into one padded generation
+    # batch. API workers leave this to the shared process, which batches
+    # the generation calls of all workers.
+    if batch and config.BATCH_MAX_SIZE > 1:
+        batcher = BatchScheduler(
+            chatbot.get_responses,
+            max_batch_size=config.BATCH_MAX_SIZE,
+            max_wait_ms=config.BATCH_MAX_WAIT_MS
+        )
+        answer = batcher.run
+    else:
+        answer = chatbot.get_response
+
+    # Multi-hop questions: subqueries of one DAG level run in parallel
+    reasoner = ReasoningDAGExecutor(
+        chatbot,
+        answer=answer,
+        max_parallel=config.DAG_MAX_PARALLEL,
+        max_nodes=config.DAG_MAX_NODES
+    )
+
+    # Self-RAG: relevance filtering and critic-driven re-retrieval
+    self_rag = SelfRAGPipeline(
+        chatbot,
+        max_expert_calls=config.SELF_RAG_MAX_EXPERT_CALLS,
+        candidates=config.SELF_RAG_CANDIDATES
+    )
+
+    # Batch queries: one embedding call and one FAISS search for the whole
+    # list, then padded generation batches
+    def batch_items(questions, stopped=None):
+        for i, (response, sources, context) in chatbot.iter_responses(questions, config.BATCH_GENERATION_SIZE,
+                                                                      stopped):
+            yield {"index": i, "response": response, "sources": sources, "context": context}
+
+    def cache_stats():
+        if chatbot.cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **chatbot.cache.stats()}
+
+    return {
+        "answer": answer,
+        "reasoning": reasoner.run,
+        "self_rag": self_rag.run,
+        "stream": chatbot.stream_response,
+        "batch": batch_items,
+        "cache_stats": cache_stats,
+    }
+
+
+class InferenceServer:
+    """Serve generation, batch job state and metrics on a Unix socket.
+
+    Each client connection gets a thread and carries one call at a time, so
+    clients keep a pool of connections. At most `workers` generation calls
+    run at once, and single-prompt calls are micro-batched when
+    BATCH_MAX_SIZE > 1; all other calls are answered immediately. Each
+    generation call runs under a StageTimer whose stages and counts are
+    sent back with its result, for the worker's request timer; this
+    process's own Metrics record them once for /metrics.
+    """
+
+    def __init__(self, chatbot, workers=1, jobs_keep=100):
+        self.chatbot = chatbot
+        self.slots = threading.BoundedSemaphore(workers)
+        self.batcher = None
+        if config.BATCH_MAX_SIZE > 1:
+            self.batcher = BatchScheduler(
+                lambda prompts: self.chatbot.backend.generate_batch(prompts),
+                max_batch_size=config.BATCH_MAX_SIZE,
+                max_wait_ms=config.BATCH_MAX_WAIT_MS
+            )
+        self.jobs = BatchJobStore(keep=jobs_keep)
+        self.metrics = Metrics()
+        add_listener(self.metrics.on_stage)
+        add_count_listener(self.metrics.on_count)
+        self.worker_metrics = {}  # worker id -> (push time, snapshot)
+        self.metrics_lock = threading.Lock()
+        self.ready = threading.Event()
+        self.load_error = None
+        self.generation = {
+            "generate": self.generate,
+            "generate_batch": lambda prompts, max_new_tokens=None: self.chatbot.backend.generate_batch(
+                prompts, max_new_tokens),
+            "stream": lambda prompt, max_new_tokens=None: self.chatbot.backend.stream(prompt, max_new_tokens),
+        }
+        self.calls = {
+            "status": self.status,
+            "register_prefix": self.chatbot.register_prefix,
+            "create_job": lambda total: self.jobs.create(total).summary(),
+            "start_job": lambda job_id: self.job(job_id).start(),
+            "add_job_item": lambda job_id, item: self.job(job_id).add(item),
+            "finish_job": lambda job_id, error=None: self.job(job_id).finish(error),
+            "job_summary": lambda job_id: self.job(job_id).summary(),
+            "get_job": self.get_job,
+            "discard_job": self.jobs.discard,
+            "push_metrics": self.push_metrics,
+            "metrics": self.metrics_snapshots,
+        }
+
+    def warm_up(self):
+        """Bring the index up to date for the workers, then load the model
+        if generation runs here. The embeddings and index used for the
+        update are dropped again; workers load their own."""
+        try:
+            self.chatbot.load_component("vectorstore", self.chatbot.setup_vectorstore, self.chatbot.docs_dir)
+            self.chatbot.vectorstore = self.chatbot.embeddings = self.chatbot.sparse = None
+            if config.GENERATION_BACKEND == "transformers":
+                self.chatbot.load_component("model", self.chatbot.setup_model)
+        except Exception as e:
+            self.load_error = str(e)
+            print(f"Initialization failed: {e}")
+            return
+        self.ready.set()
+
+    def status(self):
+        components = self.chatbot.load_status()
+        return {
+            "ready": self.ready.is_set(),
+            "error": self.load_error,
+            "components": {name: components[name] for name in ("vectorstore", "model")},
+        }
+
+    def generate(self, prompt, max_new_tokens=None):
+        if self.batcher is not None and max_new_tokens is None:
+            return self.batcher.run(prompt)
+        return self.chatbot.backend.generate(prompt, max_new_tokens)
+
+    def job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown batch job {job_id}")
+        return job
+
+    def get_job(self, job_id, offset=0):
+        job = self.jobs.get(job_id)
+        return None if job is None else job.to_dict(offset)
+
+    def push_metrics(self, worker_id, snapshot):
+        with self.metrics_lock:
+            self.worker_metrics[worker_id] = (time.monotonic(), snapshot)
+
+    def metrics_snapshots(self, worker_id=None):
+        """This process's metrics and those last pushed by every worker but
+        `worker_id`. Counters of workers that stopped pushing, e.g. after a
+        restart, are kept so totals never go down; their gauges are not."""
+        stale = time.monotonic() - 3 * METRICS_PUSH_SECONDS
+        snapshots = [self.metrics.snapshot()]
+        with self.metrics_lock:
+            for other, (pushed, snapshot) in self.worker_metrics.items():
+                if other == worker_id:
+                    continue
+                if pushed < stale:
+                    snapshot = {name: values for name, values in snapshot.items() if isinstance(values, dict)}
+                snapshots.append(snapshot)
+        return snapshots
+
+    def serve_forever(self, address, authkey=None):
+        Path(address).unlink(missing_ok=True)  # stale socket of a previous run
+        with Listener(address, family="AF_UNIX", authkey=authkey) as listener:
+            os.chmod(address, 0o600)
+            print(f"Inference server listening on {address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except (OSError, AuthenticationError) as e:
+                    print(f"Rejected inference client: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), name="inference-client", daemon=True).start()
+
+    def handle(self, conn):
+        try:
+            while True:
+                try:
+                    name, args = conn.recv()
+                except EOFError:
+                    return
+                self.dispatch(conn, name, args)
+        except OSError:
+            pass  # client went away mid-reply, e.g. a cancelled stream
+        finally:
+            conn.close()
+
+    def dispatch(self, conn, name, args):
+        if name in self.calls:
+            try:
+                reply = ("ok", self.calls[name](*args), ({}, {}))
+            except Exception as e:
+                reply = ("error", str(e), ({}, {}))
+            conn.send(reply)
+            return
+        if name not in self.generation:
+            conn.send(("error", f"Unknown call {name!r}", ({}, {})))
+            return
+
+        timer = StageTimer()
+        try:
+            if self.chatbot.backend is None:
+                raise RemoteError("No model is loaded in the shared process")
+            with self.slots, timer:
+                if name == "stream":
+                    for text in self.generation[name](*args):
+                        conn.send(("item", text, None))
+                    result = None
+                else:
+                    result = self.generation[name](*args)
+            conn.send(("ok", result, (timer.stages, timer.counts)))
+        except OSError:
+            raise
+        except Exception as e:
+            conn.send(("error", str(e), (timer.stages, timer.counts)))
+
+
+class InferenceClient:
+    """Connection pool to an InferenceServer.
+
+    Up to `connections` calls run at once, each on its own socket
+    connection. Stage timings and counts of a generation call are added to
+    the calling thread's StageTimer only: the server's metrics already
+    recorded them.
+    """
+
+    def __init__(self, address, authkey=None, connections=4, poll_seconds=1):
+        self.address = address
+        self.authkey = authkey
+        self.poll_seconds = poll_seconds
+        self.slots = threading.BoundedSemaphore(connections)
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        return Client(self.address, family="AF_UNIX", authkey=self.authkey)
+
+    @contextmanager
+    def connection(self):
+        with self.slots:
+            with self.lock:
+                conn = self.idle.pop() if self.idle else None
+            conn = conn or self.connect()
+            try:
+                yield conn
+            except BaseException:
+                # Mid-call failure or an abandoned stream: the connection may
+                # still have a reply in flight, so it cannot be reused
+                conn.close()
+                raise
+            with self.lock:
+                self.idle.append(conn)
+
+    def call(self, name, *args):
+        with self.connection() as conn:
+            conn.send((name, args))
+            status, result, report = conn.recv()
+        merge(*report)
+        if status == "error":
+            raise RemoteError(result)
+        return result
+
+    def iter(self, name, *args):
+        """Stream a call's items; closing the generator drops the connection"""
+        with self.connection() as conn:
+            conn.send((name, args))
+            while True:
+                status, result, report = conn.recv()
+                if status != "item":
+                    break
+                yield result
+        merge(*report)
+        if status == "error":
+            raise RemoteError(result)
+
+    def status(self):
+        # A fresh connection, so health checks never wait behind long calls
+        with self.connect() as conn:
+            conn.send(("status", ()))
+            _, result, _ = conn.recv()
+        return result
+
+    def wait_ready(self):
+        """Wait until the shared process has updated the index and loaded the model"""
+        start = time.perf_counter()
+        while True:
+            try:
+                status = self.status()
+            except (OSError, EOFError):
+                status = None  # not listening yet
+            if status and status["ready"]:
+                print(f"Inference server at {self.address} ready after {time.perf_counter() - start:.1f}s")
+                return
+            if status and status["error"]:
+                raise RemoteError(f"Inference server failed to load: {status['error']}")
+            time.sleep(self.poll_seconds)
+
+
+class RemoteBackend:
+    """Generation backend (see generation_backend.py) running in the shared process"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def register_prefix(self, text):
+        self.client.call("register_prefix", text)
+
+    def generate(self, prompt, max_new_tokens=None):
+        return self.client.call("generate", prompt, max_new_tokens)
+
+    def generate_batch(self, prompts, max_new_tokens=None):
+        return self.client.call("generate_batch", prompts, max_new_tokens)
+
+    def stream(self, prompt, max_new_tokens=None):
+        return self.client.iter("stream", prompt, max_new_tokens)
+
+
+class RemoteJob:
+    """BatchJob whose state is kept in the shared process"""
+
+    def __init__(self, client, job_id):
+        self.client = client
+        self.id = job_id
+
+    def start(self):
+        self.client.call("start_job", self.id)
+
+    def add(self, item):
+        self.client.call("add_job_item", self.id, item)
+
+    def finish(self, error=None):
+        self.client.call("finish_job", self.id, error)
+
+    def summary(self):
+        return self.client.call("job_summary", self.id)
+
+    def to_dict(self, offset=0):
+        """None once the shared process no longer knows the job"""
+        return self.client.call("get_job", self.id, offset)
+
+
+class RemoteJobStore(BatchJobStore):
+    """BatchJobStore for API workers: a job runs in the worker that
+    created it, and its progress is kept in the shared process, where a
+    poll through any worker finds it"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def create(self, total):
+        return RemoteJob(self.client, self.client.call("create_job", total)["id"])
+
+    def get(self, job_id):
+        return RemoteJob(self.client, job_id)
+
+    def discard(self, job_id):
+        self.client.call("discard_job", job_id)
+
+
+def push_metrics(client, metrics):
+    """Send this worker's metrics to the shared process every METRICS_PUSH_SECONDS"""
+    while True:
+        time.sleep(METRICS_PUSH_SECONDS)
+        try:
+            client.call("push_metrics", os.getpid(), metrics.snapshot())
+        except (OSError, EOFError, RemoteError) as e:
+            print(f"Could not push metrics: {e}")
+
+
+def render_metrics(client, metrics):
+    """This worker's current metrics plus everything the shared process
+    holds: its own generation metrics and the other workers' last pushes"""
+    return metrics.render(client.call("metrics", os.getpid()))
+
+
+def serve(address, authkey=None):
+    """Serve on `address` until the process exits.
+
+    The index update and model load run in the background, so workers can
+    poll the status during the cold start.
+    """
+    server = InferenceServer(RAGChatbot(lazy=True), inference_workers(), config.BATCH_JOBS_KEEP)
+    threading.Thread(target=server.warm_up, name="warm-up", daemon=True).start()
+    server.serve_forever(address, authkey)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared generation, batch jobs and metrics for chat_app API workers")
+    parser.add_argument("--socket", default=config.INFERENCE_SOCKET or "junction-inference.sock",
+                        help="Unix socket path (default: JUNCTION_INFERENCE_SOCKET)")
+    args = parser.parse_args()
+    serve(args.socket, config.INFERENCE_AUTHKEY.encode() if config.INFERENCE_AUTHKEY else None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from langchain.document_loaders import TextLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+
+def load_and_split(path, digest, chunk_size, chunk_overlap):
+    """Load and split one file, tagging every chunk with a stable id.
+
+    Runs in a worker process, so it only takes picklable arguments.
+    """
+    documents = TextLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True  # lets ContextPacker merge overlapping neighbours
+    )
+    chunks = splitter.split_documents(documents)
+    for i, chunk in enumerate(chunks):
+        chunk.metadata["chunk_id"] = f"{path}#{digest[:12]}#{i}"
+    return chunks
+
+
+class IngestionPipeline:
+    """Load and split files in a process pool and embed their chunks in
+    fixed-size batches.
+
+    `run` yields (chunks, vectors) batches as soon as they are embedded, so
+    callers can add them to the index while later files are still being
+    read. At most `2 * workers` files are in flight and at most one batch
+    plus one file's chunks are buffered, which keeps peak memory bounded
+    regardless of corpus size.
+    """
+
+    def __init__(self, embeddings, workers=0, batch_size=256, chunk_size=1000,
+                 chunk_overlap=200, progress_every=10):
+        self.embeddings = embeddings
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.progress_every = progress_every
+        self.loaded = {}  # path -> (digest, chunk ids)
+        self.failed = {}  # path -> error message
+
+    def iter_files(self, files):
+        """Yield (path, digest, chunks) per file as workers finish them"""
+        pending = iter(files.items())
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            in_flight = {}
+
+            def refill():
+                while len(in_flight) < 2 * self.workers:
+                    item = next(pending, None)
+                    if item is None:
+                        return
+                    path, digest = item
+                    future = executor.submit(
+                        load_and_split, path, digest, self.chunk_size, self.chunk_overlap
+                    )
+                    in_flight[future] = (path, digest)
+
+            refill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, digest = in_flight.pop(future)
+                    try:
+                        yield path, digest, future.result()
+                    except Exception as e:
+                        print(f"Error loading {path}: {e}")
+                        self.failed[path] = str(e)
+                refill()
+
+    def run(self, files):
+        """Yield embedded (chunks, vectors) batches for a {path: digest} dict"""
+        start = last_report = time.perf_counter()
+        total_bytes = sum(os.path.getsize(path) for path in files)
+        done_bytes = 0
+        num_chunks = 0
+        buffer = []
+
+        def report(final=False):
+            elapsed = max(time.perf_counter() - start, 1e-9)
+            print(
+                f"{'Indexed' if final else 'Indexing'}: "
+                f"{len(self.loaded) + len(self.failed)}/{len(files)} files, "
+                f"{num_chunks} chunks, {done_bytes / total_bytes * 100 if total_bytes else 100:.0f}% of bytes "
+                f"({num_chunks / elapsed:.1f} chunks/s, {done_bytes / elapsed / 1e6:.2f} MB/s)"
+            )
+
+        def embed(batch):
+            vectors = self.embeddings.embed_documents([chunk.page_content for chunk in batch])
+            return batch, vectors
+
+        for path, digest, chunks in self.iter_files(files):
+            self.loaded[path] = (digest, [chunk.metadata["chunk_id"] for chunk in chunks])
+            done_bytes += os.path.getsize(path)
+            buffer.extend(chunks)
+            while len(buffer) >= self.batch_size:
+                batch, buffer = buffer[:self.batch_size], buffer[self.batch_size:]
+                yield embed(batch)
+                num_chunks += len(batch)
+            if time.perf_counter() - last_report >= self.progress_every:
+                report()
+                last_report = time.perf_counter()
+
+        if buffer:
+            yield embed(buffer)
+            num_chunks += len(buffer)
+        report(final=True)
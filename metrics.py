@@ -0,0 +1,205 @@
+import json
+import math
+import threading
+import time
+
+# Seconds; covers cache hits (sub-millisecond) up to long generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+    @staticmethod
+    def combine(values, other):
+        for key, value in other.items():
+            values[key] = values.get(key, 0) + value
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted((self.snapshot() if values is None else values).items()):
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def snapshot(self):
+        with self.lock:
+            return {key: list(series) for key, series in self.series.items()}
+
+    @staticmethod
+    def combine(values, other):
+        for key, series in other.items():
+            if key in values:
+                values[key] = [a + b for a, b in zip(values[key], series)]
+            else:
+                values[key] = list(series)
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for key, series in sorted((self.snapshot() if values is None else values).items()):
+            for bound, bucket in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{format_labels(names, key + (bound,))} {bucket}")
+            count = series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{format_labels(names, key + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {series[-1]}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time. Values of several
+    processes are combined with `combine`, e.g. sum or min."""
+
+    def __init__(self, name, help, read, combine=sum):
+        self.name = name
+        self.help = help
+        self.read = read
+        self.combine = combine
+
+    def snapshot(self):
+        value = self.read()
+        if value is None or (isinstance(value, float) and math.isnan(value)):
+            return None
+        return value
+
+    def render(self, values=None):
+        values = [value for value in ([self.snapshot()] if values is None else values) if value is not None]
+        if not values:
+            return []
+        value = self.combine(values)
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+
+class Metrics:
+    """Request, stage and token metrics in the Prometheus text format.
+
+    Stage timings and token counts arrive through stage_timer listeners, so
+    every timed block of RAGChatbot is covered in whichever thread it runs.
+    `observe_request` adds the per-request totals and, above
+    `slow_request_seconds`, appends the request's stage breakdown to
+    `slow_request_log` as one JSON line.
+
+    With several processes, each sends `snapshot()` to one of them and
+    `render(snapshots)` adds the others' snapshots to this process's values.
+    """
+
+    def __init__(self, slow_request_seconds=0, slow_request_log=None):
+        self.slow_request_seconds = slow_request_seconds
+        self.slow_request_log = slow_request_log
+        self.log_lock = threading.Lock()
+        self.stage_seconds = Histogram(
+            "rag_stage_seconds", "Time spent in each RAG pipeline stage", labels=("stage",)
+        )
+        self.request_seconds = Histogram(
+            "rag_request_seconds", "End-to-end request latency", labels=("endpoint",)
+        )
+        self.requests = Counter(
+            "rag_requests_total", "Requests by endpoint and outcome", labels=("endpoint", "status")
+        )
+        self.tokens = Counter("rag_tokens_total", "Prompt and completion tokens", labels=("kind",))
+        self.request_tokens = Histogram(
+            "rag_request_tokens", "Tokens per request", labels=("kind",), buckets=TOKEN_BUCKETS
+        )
+        self.slow_requests = Counter("rag_slow_requests_total", "Requests above the slow-request threshold")
+        self.gauges = []
+
+    def add_gauge(self, name, help, read, combine=sum):
+        self.gauges.append(Gauge(name, help, read, combine))
+
+    def on_stage(self, name, seconds):
+        self.stage_seconds.observe(seconds, stage=name)
+
+    def on_count(self, name, amount):
+        if name.endswith("_tokens"):
+            self.tokens.inc(amount, kind=name[:-len("_tokens")])
+
+    def observe_request(self, endpoint, seconds, status="ok", timer=None, detail=None):
+        self.request_seconds.observe(seconds, endpoint=endpoint)
+        self.requests.inc(endpoint=endpoint, status=status)
+        if timer is not None:
+            for name, amount in timer.counts.items():
+                if name.endswith("_tokens"):
+                    self.request_tokens.observe(amount, kind=name[:-len("_tokens")])
+        if self.slow_request_seconds and seconds >= self.slow_request_seconds:
+            self.slow_requests.inc()
+            record = {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "endpoint": endpoint,
+                "status": status,
+                "seconds": round(seconds, 4),
+                "stages": {name: round(value, 4) for name, value in (timer.stages if timer else {}).items()},
+                "counts": dict(timer.counts) if timer else {},
+                "detail": detail,
+            }
+            print(f"Slow request ({seconds:.2f}s): {json.dumps(record)}")
+            if self.slow_request_log:
+                with self.log_lock, open(self.slow_request_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def metrics(self):
+        return (self.request_seconds, self.requests, self.stage_seconds, self.tokens,
+                self.request_tokens, self.slow_requests, *self.gauges)
+
+    def snapshot(self):
+        """Current values by metric name, picklable"""
+        return {metric.name: metric.snapshot() for metric in self.metrics()}
+
+    def render(self, snapshots=()):
+        lines = []
+        for metric in self.metrics():
+            if isinstance(metric, Gauge):
+                values = [metric.snapshot()] + [snapshot[metric.name] for snapshot in snapshots
+                                                if metric.name in snapshot]
+            else:
+                values = metric.snapshot()
+                for snapshot in snapshots:
+                    metric.combine(values, snapshot.get(metric.name, {}))
+            lines.extend(metric.render(values))
+        return "\n".join(lines) + "\n"
@@ -1,107 +1,372 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import FAISS
 from langchain.prompts import PromptTemplate
-from langchain.document_loaders import TextLoader
-import torch
-from huggingface_hub import login
+from langchain.schema import Document
+import faiss
+import numpy as np
 from pathlib import Path
-from config import get_token
+from stage_timer import stage
+from generation_backend import HTTPBackend, TransformersBackend, from_hub, load_tokenizer
+from ingest import IngestionPipeline
+from context_packer import ContextPacker
+from reranker import CrossEncoderReranker
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from faiss_index import add_chunks, build_index, create_store, load_store, remove_chunks, tune_index
+import config
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock
+
+MODEL_NAME = "mistralai/Mistral-7B-Instruct-v0.1"
+EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+MANIFEST_FILE = "manifest.json"
 
 class RAGChatbot:
-    def __init__(self, model_dir=None, docs_dir="./docs"):
+    def __init__(self, model_dir=None, docs_dir="./docs", model_name=MODEL_NAME, cache=None,
+                 embedding_model=EMBEDDING_MODEL, vector_store_dir="vector_store", lazy=False,
+                 max_new_tokens=512, context_tokens=None, backend=None, update_index=True):
         print("Initializing RAG Chatbot...")
         self.model_dir = Path(model_dir) if model_dir else None
-        self.setup_model()
-        self.setup_vectorstore(docs_dir)
-        self.setup_prompt_template()
+        self.docs_dir = docs_dir
+        self.model_name = model_name
+        self.embedding_model = embedding_model
+        self.vector_store_dir = Path(vector_store_dir)
+        self.cache = cache  # optional ResponseCache
+        # Generation and context limits; small models need lower ones
+        self.max_new_tokens = max_new_tokens
+        self.context_tokens = config.CONTEXT_TOKEN_BUDGET if context_tokens is None else context_tokens
+        # Load state per component, for readiness checks
+        self.components = {name: {"status": "pending", "seconds": None}
+                           for name in ("model", "vectorstore", "reranker", "prompt")}
+        self.components_lock = Lock()
+        self.ready = Event()
+        self.load_error = None
+        # Fixed prompt prefixes whose key/values the backend may cache
+        self.prefixes = []
+        self.backend = None
+        # A backend generating in another process, e.g. inference_server.RemoteBackend
+        self.shared_backend = backend
+        # With update_index=False the index is only read, never rebuilt; another
+        # process keeps it in step with ./docs
+        self.update_index = update_index
+        # With lazy=True the caller runs warm_up(), e.g. in a background thread
+        if not lazy:
+            self.warm_up()
 
-    def setup_model(self):
-        print("Loading language model...")
-        token = get_token()
-        login(token=token)
+    def warm_up(self):
+        """Load all components, the independent ones in parallel.
 
-        model_name = "mistralai/Mistral-7B-Instruct-v0.1"
+        The language model, the vector store (embeddings and index) and the
+        reranker load concurrently; the prompt/context packer needs the
+        tokenizer and follows the model. Sets `ready` on success and
+        re-raises the first failure otherwise.
+        """
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                futures = [
+                    executor.submit(self.load_component, "model", self.setup_model),
+                    executor.submit(self.load_component, "vectorstore", self.setup_vectorstore, self.docs_dir),
+                    executor.submit(self.load_component, "reranker", self.setup_reranker),
+                ]
+            for future in futures:
+                future.result()
+            self.load_component("prompt", self.setup_prompt_template)
+        except Exception as e:
+            self.load_error = str(e)
+            raise
+        self.ready.set()
+        print(f"RAG Chatbot ready in {time.perf_counter() - start:.1f}s")
+
+    def load_component(self, name, setup, *args):
+        """Run one setup step, recording its status and load time"""
+        with self.components_lock:
+            self.components[name] = {"status": "loading", "seconds": None}
+        start = time.perf_counter()
+        try:
+            setup(*args)
+        except Exception as e:
+            print(f"Loading {name} failed: {e}")
+            with self.components_lock:
+                self.components[name] = {"status": "failed", "seconds": time.perf_counter() - start,
+                                         "error": str(e)}
+            raise
+        with self.components_lock:
+            self.components[name] = {"status": "ready", "seconds": time.perf_counter() - start}
 
+    def load_status(self):
+        """Snapshot of per-component load state"""
+        with self.components_lock:
+            return {name: dict(state) for name, state in self.components.items()}
+
+    def setup_model(self):
+        print("Loading language model...")
         if self.model_dir:
             self.model_dir.mkdir(parents=True, exist_ok=True)
             print(f"Using model directory: {self.model_dir}")
 
-        self.tokenizer = AutoTokenizer.from_pretrained(
-            model_name,
-            trust_remote_code=True,
-            cache_dir=self.model_dir
-        )
+        if self.shared_backend is not None:
+            # The model is loaded once in a shared process; only the
+            # tokenizer is needed here, for prompts and context packing
+            self.set_backend(self.shared_backend)
+            self.tokenizer = self.setup_tokenizer(self.model_name)
+            return
 
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_name,
-            torch_dtype=torch.float16,
-            device_map="auto",
-            trust_remote_code=True,
-            cache_dir=self.model_dir
-        )
+        if config.GENERATION_BACKEND == "transformers":
+            backend = TransformersBackend(
+                self.model_name,
+                self.model_dir,
+                max_new_tokens=self.max_new_tokens,
+                prefix_cache=config.PREFIX_CACHE,
+                prefix_cache_tokens=config.PREFIX_CACHE_TOKENS
+            )
+            self.tokenizer = backend.tokenizer
+            self.set_backend(backend)
+            return
+
+        # A model server does the generation; only the tokenizer is loaded
+        # here, for counting context tokens
+        self.set_backend(HTTPBackend(
+            config.GENERATION_URL,
+            config.GENERATION_MODEL,
+            api=config.GENERATION_BACKEND,
+            concurrency=config.GENERATION_CONCURRENCY,
+            timeout=config.GENERATION_TIMEOUT,
+            api_key=config.GENERATION_API_KEY or None,
+            max_new_tokens=self.max_new_tokens
+        ))
+        print(f"Generating with {config.GENERATION_MODEL} at {config.GENERATION_URL} ({config.GENERATION_BACKEND} API)")
+        self.tokenizer = self.setup_tokenizer(config.GENERATION_TOKENIZER or self.model_name)
 
-        self.pipe = pipeline(
-            "text-generation",
-            model=self.model,
-            tokenizer=self.tokenizer,
-            max_new_tokens=512,
-            temperature=0.7,
+    def setup_tokenizer(self, tokenizer_name):
+        return from_hub(
+            lambda local_files_only: load_tokenizer(tokenizer_name, self.model_dir, local_files_only),
+            tokenizer_name,
+            self.model_dir
         )
 
-    def load_documents(self, docs_dir):
-        """Load documents without using DirectoryLoader"""
-        documents = []
-        docs_path = Path(docs_dir)
-        
-        # Recursively find all .txt files
-        for file_path in docs_path.rglob("*.txt"):
-            try:
-                loader = TextLoader(str(file_path))
-                documents.extend(loader.load())
-                print(f"Loaded: {file_path}")
-            except Exception as e:
-                print(f"Error loading {file_path}: {e}")
-                
-        return documents
+    def set_backend(self, backend):
+        with self.components_lock:
+            self.backend = backend
+            for prefix in self.prefixes:
+                backend.register_prefix(prefix)
+
+    def register_prefix(self, text):
+        """Declare a fixed prompt prefix (e.g. an expert prompt) whose
+        prefill the backend can compute once and reuse"""
+        with self.components_lock:
+            self.prefixes.append(text)
+            if self.backend is not None:
+                self.backend.register_prefix(text)
+
+    def file_hash(self, file_path):
+        """Return the sha256 hex digest of a file's content"""
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def load_manifest(self, vector_store_dir):
+        """Load the per-file hash/chunk-id manifest of the vector store"""
+        manifest_path = vector_store_dir / MANIFEST_FILE
+        try:
+            if manifest_path.exists():
+                manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+                if (manifest.get("embedding_model") == self.embedding_model
+                        and manifest.get("index_type", "flat") == config.INDEX_TYPE):
+                    return manifest
+                print("Embedding model or index type changed, ignoring existing manifest")
+        except Exception as e:
+            print(f"Could not read manifest: {e}")
+        return None
+
+    def save_manifest(self, vector_store_dir, files):
+        """Atomically write the manifest next to the FAISS index"""
+        manifest_path = vector_store_dir / MANIFEST_FILE
+        tmp_path = manifest_path.with_suffix(".tmp")
+        tmp_path.write_text(
+            json.dumps({
+                "embedding_model": self.embedding_model,
+                "index_type": config.INDEX_TYPE,
+                "files": files
+            }, indent=2),
+            encoding="utf-8"
+        )
+        os.replace(tmp_path, manifest_path)
 
     def setup_vectorstore(self, docs_dir):
         print("Setting up vector store...")
-        vector_store_dir = Path("vector_store")
-        vector_store_dir.mkdir(exist_ok=True)
+        vector_store_dir = self.vector_store_dir
+        vector_store_dir.mkdir(parents=True, exist_ok=True)
 
         # Initialize embeddings first as we need it in both cases
         self.embeddings = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-mpnet-base-v2"
+            model_name=self.embedding_model
         )
 
-        # Try to load existing vector store
+        # Sparse BM25 index kept in step with FAISS for hybrid retrieval
+        self.sparse = BM25Index(vector_store_dir / "bm25") if config.HYBRID_SEARCH else None
+
+        # Without a manifest we cannot tell which chunks belong to which
+        # file, so an index without one is rebuilt from scratch.
+        manifest = self.load_manifest(vector_store_dir)
+        indexed = {}
+        if manifest and (vector_store_dir / "index.faiss").exists():
+            indexed = manifest["files"]
+
+        if not self.update_index:
+            if not indexed:
+                raise Exception(f"No vector store in {vector_store_dir}; it is built by the process that updates it")
+            # Nothing writes to it here, so IVF lists can always be shared pages
+            print("Loading existing vector store read-only...")
+            self.vectorstore = load_store(
+                vector_store_dir,
+                self.embeddings,
+                mmap=config.INDEX_MMAP or config.INDEX_TYPE in ("ivf_flat", "ivf_pq")
+            )
+            self.index_version = self.manifest_version(indexed)
+            tune_index(self.vectorstore.index, config.INDEX_NPROBE, config.INDEX_EF_SEARCH)
+            return
+
+        # Diff ./docs against the manifest by content hash
+        current = {}
+        for file_path in Path(docs_dir).rglob("*.txt"):
+            try:
+                current[str(file_path)] = self.file_hash(file_path)
+            except Exception as e:
+                print(f"Error hashing {file_path}: {e}")
+        changed = indexed.keys() != current.keys() or any(
+            current[path] != entry["hash"] for path, entry in indexed.items()
+        )
+
+        # Try to load existing vector store; memory-map it when it will not be modified
+        self.vectorstore = None
         try:
-            if list(vector_store_dir.glob("*.faiss")):
+            if indexed:
                 print("Loading existing vector store...")
-                self.vectorstore = FAISS.load_local(
-                    "vector_store",
-                    self.embeddings
+                self.vectorstore = load_store(
+                    vector_store_dir,
+                    self.embeddings,
+                    mmap=config.INDEX_MMAP and not changed
                 )
-                return
         except Exception as e:
             print(f"Could not load existing vector store: {e}")
+            indexed = {}
 
-        print("Creating new vector store...")
-        documents = self.load_documents(docs_dir)
-        if not documents:
-            raise Exception("No documents found in the specified directory")
+        stale_ids = []
+        for path, entry in indexed.items():
+            if current.get(path) != entry["hash"]:
+                stale_ids.extend(entry["chunks"])
 
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        files = {path: entry for path, entry in indexed.items() if current.get(path) == entry["hash"]}
+        to_load = {path: digest for path, digest in current.items() if path not in files}
+
+        if self.vectorstore is not None and not stale_ids and not to_load:
+            self.index_version = self.manifest_version(files)
+            print("Vector store is up to date")
+            if self.sparse is not None and not len(self.sparse):
+                self.backfill_sparse()
+            tune_index(self.vectorstore.index, config.INDEX_NPROBE, config.INDEX_EF_SEARCH)
+            return
+
+        if self.vectorstore is None:
+            print("Creating new vector store...")
+            if self.sparse is not None:
+                self.sparse.clear()
+        else:
+            if stale_ids:
+                print(f"Removing {len(stale_ids)} stale chunks from vector store...")
+                remove_chunks(self.vectorstore, stale_ids)
+            if self.sparse is not None:
+                if len(self.sparse):
+                    self.sparse.delete(stale_ids)
+                else:
+                    self.backfill_sparse()
+
+        # Stream new chunks into the index as they are embedded. A new
+        # IVF index needs a training sample first, so buffer until we have one.
+        pipeline = IngestionPipeline(
+            self.embeddings,
+            workers=config.INGEST_WORKERS,
+            batch_size=config.EMBED_BATCH_SIZE
         )
-        chunks = text_splitter.split_documents(documents)
-        self.vectorstore = FAISS.from_documents(chunks, self.embeddings)
+        needed = config.INDEX_TRAIN_SAMPLE if config.INDEX_TYPE in ("ivf_flat", "ivf_pq") else 1
+        buffer_chunks, buffer_vectors = [], []
+        for chunks, vectors in pipeline.run(to_load):
+            if self.vectorstore is None:
+                buffer_chunks.extend(chunks)
+                buffer_vectors.extend(vectors)
+                if len(buffer_vectors) < needed:
+                    continue
+                self.vectorstore = self.create_vectorstore(buffer_vectors)
+                chunks, vectors = buffer_chunks, buffer_vectors
+                buffer_chunks, buffer_vectors = [], []
+            self.add_embedded(chunks, vectors)
+        if buffer_vectors:
+            self.vectorstore = self.create_vectorstore(buffer_vectors)
+            self.add_embedded(buffer_chunks, buffer_vectors)
+
+        for path, (digest, chunk_ids) in pipeline.loaded.items():
+            files[path] = {"hash": digest, "chunks": chunk_ids}
+        self.index_version = self.manifest_version(files)
+
+        if self.vectorstore is None or not any(entry["chunks"] for entry in files.values()):
+            raise Exception("No documents found in the specified directory")
         
-        # Save vector store
-        self.vectorstore.save_local("vector_store")
+        # Save vector store, then the manifest that describes it
+        self.vectorstore.save_local(str(vector_store_dir))
+        if self.sparse is not None:
+            self.sparse.commit()
+        self.save_manifest(vector_store_dir, files)
+        if config.INDEX_MMAP:
+            # Drop the private copy in favour of shared, read-only pages
+            self.vectorstore = load_store(vector_store_dir, self.embeddings, mmap=True)
+        tune_index(self.vectorstore.index, config.INDEX_NPROBE, config.INDEX_EF_SEARCH)
+
+    def manifest_version(self, files):
+        """Hash of the indexed file set; cached answers are tied to it"""
+        return hashlib.sha256(
+            json.dumps({path: entry["hash"] for path, entry in files.items()}, sort_keys=True).encode()
+        ).hexdigest()
+
+    def create_vectorstore(self, vectors):
+        """Build an empty store of the configured index type, trained on vectors"""
+        index = build_index(
+            config.INDEX_TYPE,
+            vectors,
+            train_sample=config.INDEX_TRAIN_SAMPLE,
+            nlist=config.INDEX_NLIST,
+            pq_m=config.INDEX_PQ_M,
+            hnsw_m=config.INDEX_HNSW_M
+        )
+        return create_store(self.embeddings, index)
+
+    def add_embedded(self, chunks, vectors):
+        """Add already embedded chunks to the vector store and BM25 index"""
+        texts = [chunk.page_content for chunk in chunks]
+        ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+        add_chunks(self.vectorstore, texts, vectors, [chunk.metadata for chunk in chunks], ids)
+        if self.sparse is not None:
+            self.sparse.add(ids, texts)
+
+    def backfill_sparse(self):
+        """Build the BM25 index from the docstore of an existing vector store"""
+        print("Building BM25 index from existing vector store...")
+        for doc_id in self.vectorstore.index_to_docstore_id.values():
+            doc = self.vectorstore.docstore.search(doc_id)
+            self.sparse.add([doc_id], [doc.page_content])
+        self.sparse.commit()
+
+    def setup_reranker(self):
+        self.reranker = None
+        if config.RERANK:
+            self.reranker = CrossEncoderReranker(
+                config.RERANK_MODEL,
+                budget_ms=config.RERANK_BUDGET_MS
+            )
 
     def setup_prompt_template(self):
         self.template = """<s>[INST] Answer the question based only on the given context. If you can't find the answer in the context, say so.
@@ -112,15 +377,203 @@ class RAGChatbot:
             input_variables=["context", "question"],
             template=self.template
         )
+        # The instruction before the context is the same in every prompt
+        self.register_prefix(self.template.split("{context}")[0])
+        # Merge/deduplicate retrieved chunks and cap the context in model tokens
+        self.packer = None
+        if self.context_tokens > 0:
+            self.packer = ContextPacker(self.tokenizer, budget_tokens=self.context_tokens)
+
+    def build_prompt(self, question, relevant_docs):
+        """Build the augmented prompt from already retrieved documents"""
+        with stage("prompt"):
+            if self.packer is not None:
+                context, sources = self.packer.pack(relevant_docs)
+            else:
+                context = "\n".join(doc.page_content for doc in relevant_docs)
+                sources = [doc.metadata.get('source', 'Unknown source') for doc in relevant_docs]
+            augmented_prompt = self.prompt.format(
+                context=context,
+                question=question
+            )
+        return augmented_prompt, sources, context
+
+    def prepare_prompt(self, question, vector=None):
+        """Retrieve context for a question and build the augmented prompt"""
+        if vector is None:
+            with stage("embed"):
+                vector = self.embeddings.embed_query(question)
+        relevant_docs = self.retrieve([question], [vector])[0]
+        return self.build_prompt(question, relevant_docs)
+
+    def retrieve(self, questions, vectors, k=None):
+        """Top-k documents per question: dense search, fused with BM25 and
+        reranked with a cross-encoder when those stages are enabled"""
+        if k is None:
+            k = config.RERANK_TOP_K if self.reranker is not None else 3
+        width = max(k, config.RERANK_CANDIDATES) if self.reranker is not None else k
+        if self.sparse is None:
+            candidates = self.search_by_vectors(vectors, k=width)
+        else:
+            candidates = [
+                self.fuse_sparse(question, dense_docs, width)
+                for question, dense_docs in zip(
+                    questions,
+                    self.search_by_vectors(vectors, k=max(width, config.HYBRID_CANDIDATES))
+                )
+            ]
+        if self.reranker is None:
+            return [docs[:k] for docs in candidates]
+        with stage("rerank"):
+            return self.reranker.rerank_many(questions, candidates, k)
+
+    def fuse_sparse(self, question, dense_docs, k):
+        """Reciprocal-rank fusion of dense hits with BM25 hits"""
+        docs_by_id = {doc.metadata.get("chunk_id"): doc for doc in dense_docs}
+        with stage("bm25"):
+            sparse_ids = [chunk_id for chunk_id, _ in self.sparse.search(question, k=len(dense_docs) or k)]
+        fused = reciprocal_rank_fusion([list(docs_by_id), sparse_ids], k=config.RRF_K)
+        relevant_docs = []
+        for chunk_id in fused:
+            doc = docs_by_id.get(chunk_id) or self.vectorstore.docstore.search(chunk_id)
+            if isinstance(doc, Document):
+                relevant_docs.append(doc)
+            if len(relevant_docs) == k:
+                break
+        return relevant_docs
+
+    def search_by_vectors(self, vectors, k=3):
+        """Run one FAISS search for a matrix of query embeddings"""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if getattr(self.vectorstore, "_normalize_L2", False):
+            faiss.normalize_L2(matrix)
+        with stage("search"):
+            _, indices = self.vectorstore.index.search(matrix, k)
+        results = []
+        for row in indices:
+            docs = []
+            for i in row:
+                if i == -1:
+                    continue
+                doc_id = self.vectorstore.index_to_docstore_id[i]
+                docs.append(self.vectorstore.docstore.search(doc_id))
+            results.append(docs)
+        return results
+
+    def lookup_cache(self, question):
+        """Return (cached answer or None, query embedding or None)"""
+        if self.cache is None:
+            return None, None
+        with stage("cache"):
+            cached = self.cache.get(question, self.index_version)
+        if cached is not None:
+            return cached, None
+        with stage("embed"):
+            vector = self.embeddings.embed_query(question)
+        with stage("cache"):
+            return self.cache.get_similar(vector, self.index_version), vector
+
+    def generate(self, prompt, max_new_tokens=None):
+        """Complete a raw prompt without retrieval; returns only the new text"""
+        with stage("generate"):
+            return self.backend.generate(prompt, max_new_tokens)
 
     def get_response(self, question):
-        relevant_docs = self.vectorstore.similarity_search(question, k=3)
-        context = "\n".join(doc.page_content for doc in relevant_docs)
-        augmented_prompt = self.prompt.format(
-            context=context,
-            question=question
-        )
-        response = self.pipe(augmented_prompt)[0]['generated_text']
-        response = response.split('[/INST]')[-1].strip()
-        sources = [doc.metadata.get('source', 'Unknown source') for doc in relevant_docs]
-        return response, sources, context
\ No newline at end of file
+        cached, vector = self.lookup_cache(question)
+        if cached is not None:
+            return cached
+        augmented_prompt, sources, context = self.prepare_prompt(question, vector)
+        with stage("generate"):
+            response = self.backend.generate(augmented_prompt)
+        if self.cache is not None:
+            self.cache.put(question, (response, sources, context), self.index_version, vector)
+        return response, sources, context
+
+    def stream_response(self, question):
+        """Yield a sources event, then answer tokens as they are generated"""
+        cached, vector = self.lookup_cache(question)
+        if cached is not None:
+            response, sources, context = cached
+            yield {"event": "sources", "sources": sources, "context": context}
+            yield {"event": "token", "text": response}
+            yield {"event": "done"}
+            return
+
+        augmented_prompt, sources, context = self.prepare_prompt(question, vector)
+        yield {"event": "sources", "sources": sources, "context": context}
+
+        pieces = []
+        with stage("generate"):
+            for text in self.backend.stream(augmented_prompt):
+                pieces.append(text)
+                yield {"event": "token", "text": text}
+        if self.cache is not None:
+            self.cache.put(question, ("".join(pieces).strip(), sources, context), self.index_version, vector)
+        yield {"event": "done"}
+
+    def get_responses(self, questions):
+        """Answer several questions with one embedding call, one FAISS search
+        and one padded generation batch"""
+        questions = list(questions)
+        results = [None] * len(questions)
+        for i, result in self.iter_responses(questions, batch_size=len(questions)):
+            results[i] = result
+        return results
+
+    def iter_responses(self, questions, batch_size=16, stopped=None):
+        """Yield (index, (response, sources, context)) for a list of questions.
+
+        Cached answers come first. All remaining questions are embedded in
+        one call and searched in one FAISS matrix search; generation then
+        runs in padded batches of `batch_size`, grouped by prompt length to
+        keep padding small, and each batch's answers are yielded as soon as
+        it finishes. Setting the `stopped` event (e.g. when the client
+        disconnects) ends the iteration before the next batch is generated.
+        """
+        questions = list(questions)
+        pending = list(range(len(questions)))
+        if self.cache is not None:
+            misses = []
+            for i in pending:
+                cached = self.cache.get(questions[i], self.index_version)
+                if cached is not None:
+                    yield i, cached
+                else:
+                    misses.append(i)
+            pending = misses
+        if not pending:
+            return
+
+        with stage("embed"):
+            vectors = self.embeddings.embed_documents([questions[i] for i in pending])
+        if self.cache is not None:
+            misses = []
+            for i, vector in zip(pending, vectors):
+                cached = self.cache.get_similar(vector, self.index_version)
+                if cached is not None:
+                    yield i, cached
+                else:
+                    misses.append((i, vector))
+            pending = [i for i, _ in misses]
+            vectors = [vector for _, vector in misses]
+            if not pending:
+                return
+
+        items = []
+        for i, vector, relevant_docs in zip(pending, vectors,
+                                            self.retrieve([questions[i] for i in pending], vectors)):
+            augmented_prompt, sources, context = self.build_prompt(questions[i], relevant_docs)
+            items.append((i, vector, augmented_prompt, sources, context))
+        items.sort(key=lambda item: len(item[2]))
+
+        for start in range(0, len(items), batch_size):
+            if stopped is not None and stopped.is_set():
+                return
+            batch = items[start:start + batch_size]
+            with stage("generate"):
+                responses = self.backend.generate_batch([item[2] for item in batch])
+            for (i, vector, _, sources, context), response in zip(batch, responses):
+                result = (response, sources, context)
+                if self.cache is not None:
+                    self.cache.put(questions[i], result, self.index_version, vector)
+                yield i, result
@@ -0,0 +1,198 @@
+import ast
+import json
+import re
+import time
+
+from prompts import reasoning_dag_prompt
+
+NODE_RE = re.compile(r"^\s*(Q[\d.]*)\s*:\s*(.+?)\s*$", re.S)
+PLACEHOLDER_RE = re.compile(r"[⟨<]A([\d.]+)[⟩>]")
+DAG_PREFIX = f"<s>[INST] {reasoning_dag_prompt}\n"
+QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+def parse_dag(text):
+    """Parse the model's DAG answer without eval.
+
+    Returns None for a simple query (a single quoted question), otherwise
+    (nodes, edges) where nodes maps labels such as "Q1.1" to their text and
+    edges is a list of (parent label, child label) pairs.
+    """
+    text = text.translate(QUOTES).strip()
+    start, end = text.find("["), text.rfind("]")
+    if start == -1 or end <= start:
+        return None
+    # Models wrap long questions across lines, which literal_eval rejects
+    snippet = re.sub(r"\s+", " ", text[start:end + 1])
+    try:
+        pairs = ast.literal_eval(snippet)
+    except (ValueError, SyntaxError):
+        try:
+            pairs = json.loads(snippet)
+        except ValueError:
+            return None
+    if not isinstance(pairs, (list, tuple)) or not pairs:
+        return None
+
+    nodes, edges = {}, []
+    for pair in pairs:
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2:
+            raise ValueError(f"Malformed DAG edge: {pair!r}")
+        labels = []
+        for node in pair:
+            match = NODE_RE.match(str(node))
+            if not match:
+                raise ValueError(f"Malformed DAG node: {node!r}")
+            label, question = match.groups()
+            nodes.setdefault(label, question)
+            labels.append(label)
+        edges.append(tuple(labels))
+    return nodes, edges
+
+
+def dag_levels(nodes, edges):
+    """Group non-root nodes into levels; a node's level is one more than its
+    deepest parent. Raises ValueError on cycles or a missing single root."""
+    parents = {label: set() for label in nodes}
+    children = {label: set() for label in nodes}
+    for parent, child in edges:
+        parents[child].add(parent)
+        children[parent].add(child)
+    roots = [label for label in nodes if not parents[label]]
+    if len(roots) != 1:
+        raise ValueError(f"DAG must have exactly one root, found {roots}")
+
+    depth = {roots[0]: 0}
+    indegree = {label: len(parents[label]) for label in nodes}
+    ready = [roots[0]]
+    while ready:
+        label = ready.pop()
+        for child in children[label]:
+            depth[child] = max(depth.get(child, 0), depth[label] + 1)
+            indegree[child] -= 1
+            if not indegree[child]:
+                ready.append(child)
+    if len(depth) != len(nodes) or any(indegree.values()):
+        raise ValueError("DAG contains a cycle")
+
+    levels = {}
+    for label, level in depth.items():
+        if level:
+            levels.setdefault(level, []).append(label)
+    return roots[0], [sorted(levels[level]) for level in sorted(levels)], parents, children
+
+
+class ReasoningDAGExecutor:
+    """Answer multi-hop questions by executing a reasoning DAG.
+
+    The model first splits the question with `reasoning_dag_prompt`. All
+    subqueries whose parents are answered go through `answer_many` together,
+    up to `max_parallel` at a time: one embedding call, one FAISS search and
+    one padded generation batch on the calling thread, so they stay within
+    the caller's inference worker and stage timer. Their answers replace the
+    ⟨A..⟩ placeholders of their children. Simple questions go straight to
+    the single-pass `answer` function.
+    """
+
+    def __init__(self, chatbot, answer=None, answer_many=None, max_parallel=4, max_nodes=12):
+        self.chatbot = chatbot
+        self.answer = answer or chatbot.get_response
+        self.answer_many = answer_many or chatbot.get_responses
+        self.max_parallel = max_parallel
+        self.max_nodes = max_nodes
+        chatbot.register_prefix(DAG_PREFIX)
+
+    def plan(self, question):
+        prompt = f"{DAG_PREFIX}Query: {question}\nDAG: [/INST]"
+        return parse_dag(self.chatbot.generate(prompt))
+
+    def run(self, question):
+        """Return a dict with the final response, sources and per-node timings"""
+        start = time.perf_counter()
+        try:
+            dag = self.plan(question)
+        except ValueError as e:
+            print(f"Could not parse reasoning DAG, answering directly: {e}")
+            dag = None
+        plan_seconds = time.perf_counter() - start
+
+        if dag is not None and len(dag[0]) > self.max_nodes:
+            print(f"Reasoning DAG has {len(dag[0])} nodes (limit {self.max_nodes}), answering directly")
+            dag = None
+        if dag is not None:
+            try:
+                root, levels, parents, children = dag_levels(*dag)
+            except ValueError as e:
+                print(f"Invalid reasoning DAG, answering directly: {e}")
+                dag = None
+
+        if dag is None:
+            (response, sources, context), seconds = self.timed(self.answer, question)
+            return {
+                "response": response,
+                "sources": sources,
+                "context": context,
+                "plan_seconds": plan_seconds,
+                "nodes": [{
+                    "id": "Q",
+                    "question": question,
+                    "answer": response,
+                    "level": 0,
+                    "seconds": seconds,
+                }],
+                "total_seconds": time.perf_counter() - start,
+            }
+
+        nodes = dag[0]
+        answers, results = {}, []
+        for level, labels in enumerate(levels, start=1):
+            for offset in range(0, len(labels), self.max_parallel):
+                batch = labels[offset:offset + self.max_parallel]
+                subqueries = [self.fill(nodes[label], answers) for label in batch]
+                # Nodes of one batch share its time
+                batch_results, seconds = self.timed(self.answer_many, subqueries)
+                for label, subquery, (response, sources, _) in zip(batch, subqueries, batch_results):
+                    answers[label] = response
+                    results.append({
+                        "id": label,
+                        "question": subquery,
+                        "answer": response,
+                        "sources": sources,
+                        "level": level,
+                        "seconds": seconds,
+                    })
+
+        sinks = [label for label in nodes if label != root and not children[label]]
+        if len(sinks) == 1:
+            response = answers[sinks[0]]
+        else:
+            # Several leaves: let a final pass combine the intermediate answers
+            facts = "\n".join(f"- {r['question']} {r['answer']}" for r in results)
+            (response, _, _), seconds = self.timed(self.answer, f"{question}\nKnown facts:\n{facts}")
+            results.append({"id": root, "question": question, "answer": response,
+                            "level": len(levels) + 1, "seconds": seconds})
+
+        sources = []
+        for result in results:
+            for source in result.get("sources", []):
+                if source not in sources:
+                    sources.append(source)
+        return {
+            "response": response,
+            "sources": sources,
+            "context": "\n".join(f"{r['question']}\n{r['answer']}" for r in results),
+            "plan_seconds": plan_seconds,
+            "nodes": results,
+            "total_seconds": time.perf_counter() - start,
+        }
+
+    @staticmethod
+    def fill(subquery, answers):
+        """Replace ⟨A1.1⟩-style placeholders with the answers of those nodes"""
+        return PLACEHOLDER_RE.sub(lambda m: answers.get(f"Q{m.group(1)}", m.group(0)), subquery)
+
+    @staticmethod
+    def timed(fn, arg):
+        start = time.perf_counter()
+        result = fn(arg)
+        return result, time.perf_counter() - start
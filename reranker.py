@@ -0,0 +1,52 @@
+import time
+
+from sentence_transformers import CrossEncoder
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class CrossEncoderReranker:
+    """Rescore retrieved candidates with a cross-encoder in one batched pass.
+
+    A moving average of the cost per (question, chunk) pair predicts how
+    long a batch will take; when the prediction exceeds `budget_ms` the
+    candidates are returned in their original dense/fused order instead.
+    """
+
+    def __init__(self, model_name=RERANK_MODEL, budget_ms=150, max_length=512):
+        print("Loading reranker...")
+        self.model = CrossEncoder(model_name, max_length=max_length)
+        self.budget = budget_ms / 1000
+        self.seconds_per_pair = None
+        self.skipped = 0
+        # Warm up so the first real request is not billed for lazy init
+        self.model.predict([("warm up", "warm up")])
+
+    def rerank_many(self, questions, candidates, top_k):
+        """Rerank one candidate list per question; returns top_k docs for each"""
+        pairs = [(question, doc.page_content)
+                 for question, docs in zip(questions, candidates) for doc in docs]
+        if not pairs:
+            return [docs[:top_k] for docs in candidates]
+        if self.seconds_per_pair is not None and self.seconds_per_pair * len(pairs) > self.budget:
+            self.skipped += 1
+            # Decay the estimate so a transient slowdown does not disable reranking for good
+            self.seconds_per_pair *= 0.9
+            return [docs[:top_k] for docs in candidates]
+
+        start = time.perf_counter()
+        scores = self.model.predict(pairs, batch_size=len(pairs))
+        per_pair = (time.perf_counter() - start) / len(pairs)
+        self.seconds_per_pair = per_pair if self.seconds_per_pair is None \
+            else 0.8 * self.seconds_per_pair + 0.2 * per_pair
+
+        results, offset = [], 0
+        for docs in candidates:
+            doc_scores = scores[offset:offset + len(docs)]
+            offset += len(docs)
+            ranked = sorted(zip(doc_scores, range(len(docs))), key=lambda item: -item[0])
+            results.append([docs[i] for _, i in ranked[:top_k]])
+        return results
+
+    def rerank(self, question, docs, top_k):
+        return self.rerank_many([question], [docs], top_k)[0]
@@ -0,0 +1,151 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ResponseCache:
+    """LRU + TTL cache of (response, sources, context) answers.
+
+    The exact tier is keyed on the normalized question. The optional
+    semantic tier compares the query embedding against cached questions and
+    returns a hit when the cosine similarity reaches `similarity_threshold`.
+    Every entry belongs to an index version; looking up with a different
+    version drops the whole cache, since retrieved context may have changed.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=3600,
+                 similarity_threshold=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (expires_at, size, value, vector)
+        self.bytes = 0
+        self.version = None
+        self._matrix = None  # stacked vectors for the semantic tier
+        self._matrix_keys = []
+        self.counters = {
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    @staticmethod
+    def normalize(question):
+        return re.sub(r"\s+", " ", question).strip().lower().rstrip("?!. ")
+
+    @staticmethod
+    def entry_size(value, vector):
+        response, sources, context = value
+        size = len(response.encode("utf-8")) + len(context.encode("utf-8"))
+        size += sum(len(source.encode("utf-8")) for source in sources)
+        if vector is not None:
+            size += vector.nbytes
+        return size
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self.entries:
+                self.counters["invalidations"] += 1
+            self._clear()
+            self.version = version
+
+    def _clear(self):
+        self.entries.clear()
+        self.bytes = 0
+        self._matrix = None
+
+    def _remove(self, key):
+        _, size, _, _ = self.entries.pop(key)
+        self.bytes -= size
+        self._matrix = None
+
+    def get(self, question, version):
+        """Exact-match lookup on the normalized question"""
+        key = self.normalize(question)
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.counters["expirations"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["exact_hits"] += 1
+            return entry[2]
+
+    def get_similar(self, vector, version):
+        """Semantic lookup; counts a miss when nothing is close enough"""
+        with self.lock:
+            self._check_version(version)
+            if self.similarity_threshold is None or not self.entries:
+                self.counters["misses"] += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = [k for k, e in self.entries.items() if e[3] is not None]
+                self._matrix = (
+                    np.stack([self.entries[k][3] for k in self._matrix_keys])
+                    if self._matrix_keys else None
+                )
+            if self._matrix is None:
+                self.counters["misses"] += 1
+                return None
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            key = self._matrix_keys[best]
+            entry = self.entries[key]
+            if scores[best] < self.similarity_threshold or entry[0] < time.monotonic():
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["semantic_hits"] += 1
+            return entry[2]
+
+    def put(self, question, value, version, vector=None):
+        key = self.normalize(question)
+        if vector is not None and self.similarity_threshold is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) or 1.0)
+        else:
+            vector = None
+        size = self.entry_size(value, vector)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self._check_version(version)
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, size, value, vector)
+            self.bytes += size
+            self._matrix = None
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.counters["evictions"] += 1
+
+    def invalidate(self):
+        with self.lock:
+            if self.entries:
+                self.counters["invalidations"] += 1
+            self._clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["exact_hits"] + self.counters["semantic_hits"] + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
@@ -1,38 +1,122 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urldefrag, urlparse
+import asyncio
 import time
 from pathlib import Path
 from urllib import robotparser
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 from icecream import ic
+import hashlib
 import json
 
+from crawl_state import CrawlState
+from document_downloader import DocumentDownloader
+
+USER_AGENT = "Mozilla/5.0 (compatible; MyWebScraper/1.0)"
+DOCUMENT_EXTENSIONS = ('.xlsx', '.xls', '.pdf', '.doc', '.docx')
+# Documents recognised by Content-Type when the URL has no such extension
+DOCUMENT_MIME_TYPES = {
+    "application/pdf": "pdf",
+    "application/msword": "doc",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/vnd.ms-excel": "xls",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "xlsx",
+}
+HTML_MIME_TYPES = ("text/html", "application/xhtml+xml")
+
+# Requests Playwright does not need to make to read a page's text
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+ANALYTICS_HOSTS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "facebook.net",
+    "hotjar.com", "clarity.ms", "segment.io", "matomo.cloud", "siteimprove.com",
+)
+# Empty mount points of client-side rendered apps
+APP_ROOT_IDS = {"root", "app", "__next", "__nuxt", "___gatsby"}
+# fetch_static result for a 304 response
+NOT_MODIFIED = object()
+# fetch_static result for responses that are not pages (images, archives, ...)
+NOT_A_PAGE = object()
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum delay between request starts.
+
+    Page fetches and document downloads have separate per-host slots, so
+    long downloads cannot starve the crawl, but share the host's delay.
+    """
+
+    def __init__(self, concurrency=2, delay=1, download_concurrency=1):
+        self.limits = {"page": concurrency, "download": download_concurrency}
+        self.delay = delay
+        self.semaphores = {}
+        self.locks = {}
+        self.next_start = {}
+
+    async def acquire(self, host, delay=None, kind="page"):
+        semaphore = self.semaphores.setdefault((kind, host), asyncio.Semaphore(self.limits[kind]))
+        await semaphore.acquire()
+        lock = self.locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            loop = asyncio.get_running_loop()
+            wait = self.next_start.get(host, 0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.next_start[host] = loop.time() + (self.delay if delay is None else delay)
+
+    def release(self, host, kind="page"):
+        self.semaphores[(kind, host)].release()
 
 
 class WebScraper:
-    def __init__(self, base_url, delay=1):
+    def __init__(self, base_url, delay=1, concurrency=4, per_host_concurrency=2,
+                 max_pages=None, settle_ms=500, ready_timeout_ms=15000, fixed_wait_ms=None,
+                 static_first=True, min_static_chars=200, state_path=None, resume=True,
+                 download_concurrency=2, per_host_downloads=1):
         self.base_url = base_url
         self.domain = urlparse(base_url).netloc
         self.visited_urls = set()
-        self.delay = delay  # Time to wait between requests
+        self.delay = delay  # Time to wait between requests to the same host
+        self.concurrency = concurrency  # Browser pages crawling in parallel
+        self.per_host_concurrency = per_host_concurrency
+        self.max_pages = max_pages
+        self.settle_ms = settle_ms  # Page text must stop changing for this long
+        self.ready_timeout_ms = ready_timeout_ms
+        self.fixed_wait_ms = fixed_wait_ms  # Old networkidle + sleep behaviour, for comparison
+        self.static_first = static_first  # Try a plain HTTP GET before rendering
+        self.min_static_chars = min_static_chars  # Less text than this looks like a JS shell
+        # Frontier and page validators survive restarts; see CrawlState
+        self.state_path = state_path or Path('scraped_site') / f"{self.domain.replace(':', '_')}.crawl.sqlite"
+        self.resume = resume
+        self.download_concurrency = download_concurrency  # Document downloads in parallel
+        self.per_host_downloads = per_host_downloads  # Separate from the page slots of a host
         self.session = requests.Session()
         self.session.headers = {
-            "User-Agent": "Mozilla/5.0 (compatible; MyWebScraper/1.0)"
+            "User-Agent": USER_AGENT
         }
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=2 * concurrency + download_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
 
         # Setup robots.txt parser
         self.rp = robotparser.RobotFileParser()
         self.rp.set_url(urljoin(base_url, "/robots.txt"))
+        self.robots_loaded = False
         try:
             self.rp.read()
+            self.robots_loaded = True
         except:
             print("Could not read robots.txt")
 
-        self.playwright = sync_playwright().start()
-        self.browser = self.playwright.chromium.launch(headless=True)
-        self.context = self.browser.new_context()
-        self.page = self.context.new_page()
+        crawl_delay = self.rp.crawl_delay(USER_AGENT) if self.robots_loaded else None
+        if crawl_delay:
+            self.delay = max(self.delay, float(crawl_delay))
+        self.limiter = HostLimiter(per_host_concurrency, self.delay, per_host_downloads)
+
+    def can_fetch(self, url):
+        """Respect robots.txt; without one, everything is allowed"""
+        return not self.robots_loaded or self.rp.can_fetch(USER_AGENT, url)
 
     def is_valid_url(self, url):
         """Check if URL is valid and belongs to the same domain"""
@@ -54,23 +138,24 @@ class WebScraper:
                     links.add(absolute_url)
         return links
 
+    def page_files(self, url):
+        """Return the (content, document links) files a page is saved to"""
+        parsed_url = urlparse(url)
+        path_parts = parsed_url.path.strip('/').split('/')
+        if not path_parts[0]:
+            path_parts = ['index']
+        save_dir = Path('scraped_site') / parsed_url.netloc / '/'.join(path_parts[:-1])
+        return (save_dir / f"{path_parts[-1] or 'index'}.txt",
+                save_dir / f"{path_parts[-1] or 'index'}_document_links.json")
+
     def save_page(self, url, content):
         """Save the scraped content to a file"""
         try:
             # Create directory structure based on URL
-            parsed_url = urlparse(url)
-            path_parts = parsed_url.path.strip('/').split('/')
-            if not path_parts[0]:
-                path_parts = ['index']
-            
-            # Create the directory
-            save_dir = Path('scraped_site') / parsed_url.netloc / '/'.join(path_parts[:-1])
+            content_file, links_file = self.page_files(url)
+            save_dir = content_file.parent
             save_dir.mkdir(parents=True, exist_ok=True)
             
-            # Save content and links separately
-            content_file = save_dir / f"{path_parts[-1] or 'index'}.txt"
-            links_file = save_dir / f"{path_parts[-1] or 'index'}_document_links.json"
-            
             # Save main content
             content_file.write_text(content['content'], encoding='utf-8')
             
@@ -83,99 +168,323 @@ class WebScraper:
             )
             
             print(f"\n✓ Saved page content and links to {save_dir}")
+            return True
             
         except Exception as e:
             print(f"✗ Error saving page {url}: {str(e)}")
+            return False
 
-    def scrape(self):
-        """Main scraping method"""
-        urls_to_visit = {self.base_url}
+    async def wait_until_ready(self, page):
+        """Wait until the rendered text stops changing instead of sleeping a fixed time"""
+        if self.fixed_wait_ms is not None:
+            await page.wait_for_load_state('networkidle', timeout=60000)
+            await page.wait_for_timeout(self.fixed_wait_ms)
+            return
 
-        while urls_to_visit:
-            url = urls_to_visit.pop()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.ready_timeout_ms / 1000
+        settle = self.settle_ms / 1000
+        last_length, stable_since = -1, loop.time()
+        while loop.time() < deadline:
+            length = await page.evaluate("() => document.body ? document.body.innerText.length : 0")
+            now = loop.time()
+            if length != last_length or length == 0:
+                last_length, stable_since = length, now
+            elif now - stable_since >= settle:
+                return
+            await asyncio.sleep(min(0.1, settle / 2))
 
-            if url in self.visited_urls:
-                continue
+    def looks_js_rendered(self, soup):
+        """Heuristic for pages whose content only appears after running scripts"""
+        body = soup.body
+        if body is None:
+            return True
+        for root_id in APP_ROOT_IDS:
+            mount = body.find(id=root_id)
+            if mount is not None and not mount.get_text(strip=True):
+                return True
+        for noscript in body.find_all("noscript"):
+            if "javascript" in noscript.get_text().lower():
+                return True
+        text = body.get_text(" ", strip=True)
+        return len(text) < self.min_static_chars and bool(soup.find_all("script"))
 
-            print(f"Scraping: {url}")
+    def fetch_static(self, url, cached=None):
+        """Fetch and parse a server-rendered page with the pooled session.
 
-            try:
-                # Navigate and wait for content
-                self.page.goto(url, timeout=60000)
-                self.page.wait_for_load_state('networkidle', timeout=60000)
-                self.page.wait_for_timeout(5000)
-
-                # Get the main page content
-                content = self.page.evaluate('''() => {
-                    const elements = document.querySelectorAll('script, style');
-                    elements.forEach(el => el.remove());
-                    return document.body.innerText;
-                }''')
-
-                # Extract document links
-                document_links = self.page.evaluate('''() => {
-                    const fileExtensions = ['.xlsx', '.xls', '.pdf', '.doc', '.docx'];
-                    return Array.from(document.querySelectorAll('a[href]'))
-                        .filter(a => fileExtensions.some(ext => a.href.toLowerCase().endsWith(ext)))
-                        .map(a => ({
-                            text: a.innerText.trim(),
-                            url: a.href,
-                            type: a.href.split('.').pop().toLowerCase()
-                        }))
-                        .filter(link => link.text);
-                }''')
-
-                if document_links:
-                    print(f"\nFound {len(document_links)} documents:")
-                    for link in document_links:
-                        try:
-                            # Create directory for the file type if it doesn't exist
-                            file_dir = Path('downloaded_files') / link['type']
-                            file_dir.mkdir(parents=True, exist_ok=True)
-                            
-                            # Clean filename
-                            clean_filename = "".join(c for c in link['text'] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                            file_path = file_dir / f"{clean_filename}.{link['type']}"
-                            
-                            # Download only if file doesn't exist
-                            if not file_path.exists():
-                                print(f"\nDownloading: {link['text']}")
-                                response = requests.get(link['url'], timeout=30)
-                                if response.status_code == 200:
-                                    file_path.write_bytes(response.content)
-                                    print(f"✓ Saved to: {file_path}")
-                                else:
-                                    print(f"✗ Failed to download: HTTP {response.status_code}")
-                            else:
-                                print(f"• Skipped (already exists): {file_path}")
-                                
-                        except Exception as e:
-                            print(f"✗ Error downloading {link['url']}: {str(e)}")
-                            continue
-
-                # Save the webpage content and document links
-                self.save_page(url, {
-                    'content': content,
-                    'document_links': document_links
+        With the stored state of a page, the request is conditional. Returns
+        (result, validators): result is (content, document_links, new_links),
+        NOT_MODIFIED on a 304, NOT_A_PAGE for anything but HTML or plain
+        text, or None when the page needs a browser. A document recognised
+        by its Content-Type comes back as its own document link.
+        """
+        headers = {}
+        if cached:
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        # Streamed, so the body of a binary response is never downloaded here
+        with self.session.get(url, headers=headers, timeout=30, stream=True) as response:
+            if response.status_code == 304:
+                return NOT_MODIFIED, (cached["etag"], cached["last_modified"])
+            response.raise_for_status()
+            validators = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+            mime_type = response.headers.get("Content-Type", "text/html").split(";")[0].strip().lower()
+            if mime_type in DOCUMENT_MIME_TYPES:
+                name = Path(urlparse(url).path).stem or "document"
+                return (None, [{'text': name, 'url': url, 'type': DOCUMENT_MIME_TYPES[mime_type]}], []), validators
+            if mime_type == "text/plain":
+                return (response.text, [], []), validators
+            if mime_type not in HTML_MIME_TYPES:
+                return NOT_A_PAGE, validators
+            text = response.text
+        soup = BeautifulSoup(text, "html.parser")
+        if self.looks_js_rendered(soup):
+            return None, validators
+
+        document_links = []
+        for link in soup.find_all("a", href=True):
+            absolute_url = urljoin(url, link["href"])
+            text = link.get_text(" ", strip=True)
+            if text and absolute_url.lower().endswith(DOCUMENT_EXTENSIONS):
+                document_links.append({
+                    'text': text,
+                    'url': absolute_url,
+                    'type': absolute_url.split('.')[-1].lower()
                 })
+        new_links = self.get_links(soup, url)
+
+        for element in soup(["script", "style", "noscript", "template"]):
+            element.decompose()
+        content = soup.body.get_text("\n", strip=True)
+        return (content, document_links, new_links), validators
+
+    async def block_resources(self, route):
+        """Abort images, fonts, media and analytics requests while rendering"""
+        request = route.request
+        host = urlparse(request.url).netloc
+        if request.resource_type in BLOCKED_RESOURCE_TYPES or host.endswith(ANALYTICS_HOSTS):
+            await route.abort()
+        else:
+            await route.continue_()
 
-                # Find new links for crawling
-                new_links = self.page.evaluate('''() => {
-                    return Array.from(document.querySelectorAll('a[href]'))
-                        .map(a => a.href)
-                        .filter(href => href.startsWith('http'));
-                }''')
-                urls_to_visit.update(set(new_links) - self.visited_urls)
+    async def render_page(self, page, url):
+        """Render one page in the browser; returns (content, document_links, new_links)"""
+        # Navigate and wait for content
+        await page.goto(url, timeout=60000, wait_until='domcontentloaded')
+        await self.wait_until_ready(page)
 
-                self.visited_urls.add(url)
+        # Get the main page content
+        content = await page.evaluate('''() => {
+            const elements = document.querySelectorAll('script, style');
+            elements.forEach(el => el.remove());
+            return document.body.innerText;
+        }''')
 
+        # Extract document links
+        document_links = await page.evaluate('''() => {
+            const fileExtensions = ['.xlsx', '.xls', '.pdf', '.doc', '.docx'];
+            return Array.from(document.querySelectorAll('a[href]'))
+                .filter(a => fileExtensions.some(ext => a.href.toLowerCase().endsWith(ext)))
+                .map(a => ({
+                    text: a.innerText.trim(),
+                    url: a.href,
+                    type: a.href.split('.').pop().toLowerCase()
+                }))
+                .filter(link => link.text);
+        }''')
+
+        # Find new links for crawling
+        new_links = await page.evaluate('''() => {
+            return Array.from(document.querySelectorAll('a[href]'))
+                .map(a => a.href)
+                .filter(href => href.startsWith('http'));
+        }''')
+        return content, document_links, new_links
+
+    async def get_page(self):
+        """Take a browser page from the pool, launching Chromium on first use"""
+        async with self.page_lock:
+            if self.pages.empty() and self.pages_created < self.concurrency:
+                if self.browser is None:
+                    self.playwright = await async_playwright().start()
+                    self.browser = await self.playwright.chromium.launch(headless=True)
+                context = await self.browser.new_context(user_agent=USER_AGENT)
+                await context.route("**/*", self.block_resources)
+                self.pages_created += 1
+                return await context.new_page()
+        return await self.pages.get()
+
+    async def scrape_page(self, url):
+        """Fetch one page (static first, browser if needed), save it and return its links"""
+        cached = self.state.page(url)
+        # Only ask for a 304 when the files it would leave alone are still there
+        conditional = cached if cached and all(path.exists() for path in self.page_files(url)) else None
+        result, validators = None, (None, None)
+        if self.static_first:
+            result, validators = await asyncio.to_thread(self.fetch_static, url, conditional)
+        if result is NOT_MODIFIED:
+            self.stats["unchanged"] += 1
+            return cached["links"]
+        if result is NOT_A_PAGE:
+            print(f"• Skipped (not a page): {url}")
+            self.stats["skipped"] += 1
+            return []
+        if result is not None and result[0] is None:
+            # A document behind a URL without a document extension
+            self.enqueue_documents(result[1])
+            self.stats["skipped"] += 1
+            return []
+        if result is None:
+            page = await self.get_page()
+            try:
+                result = await self.render_page(page, url)
+            finally:
+                self.pages.put_nowait(page)
+            self.stats["rendered"] += 1
+        else:
+            self.stats["static"] += 1
+        content, document_links, new_links = result
+
+        content_hash = hashlib.sha256(
+            json.dumps([content, document_links], ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+        if conditional and content_hash == conditional["content_hash"]:
+            # Same text as last time: keep the files (and their mtimes) as they are
+            print(f"• Unchanged: {url}")
+            self.stats["unchanged"] += 1
+            saved = True
+        else:
+            if document_links:
+                self.enqueue_documents(document_links)
+
+            # Save the webpage content and document links
+            saved = await asyncio.to_thread(self.save_page, url, {
+                'content': content,
+                'document_links': document_links
+            })
+        # A failed write must not be mistaken for unchanged content next time
+        self.state.save_page(url, *validators, content_hash if saved else None, new_links)
+        return new_links
+
+    def enqueue(self, queue, url):
+        url = urldefrag(url)[0]
+        if url in self.visited_urls or not self.is_valid_url(url):
+            return
+        if url.lower().endswith(DOCUMENT_EXTENSIONS):
+            return  # Documents go through the download workers, not the page workers
+        if self.max_pages and len(self.visited_urls) >= self.max_pages:
+            return
+        if not self.can_fetch(url):
+            print(f"• Skipped (robots.txt): {url}")
+            self.visited_urls.add(url)
+            self.state.add(url, "skipped")
+            return
+        self.visited_urls.add(url)
+        self.state.add(url)
+        queue.put_nowait(url)
+
+    def enqueue_documents(self, document_links):
+        """Hand linked documents to the download workers, once per URL"""
+        print(f"\nFound {len(document_links)} documents")
+        for link in document_links:
+            if link['url'] in self.document_urls:
+                continue
+            self.document_urls.add(link['url'])
+            self.state.add_document(link)
+            self.downloads.put_nowait(link)
+
+    async def download_worker(self):
+        """Download documents alongside the page workers, so large files
+        do not hold up the crawl"""
+        while True:
+            link = await self.downloads.get()
+            host = urlparse(link['url']).netloc
+            try:
+                await self.limiter.acquire(host, kind="download")
+                try:
+                    result = await asyncio.to_thread(self.downloader.download, link)
+                finally:
+                    self.limiter.release(host, kind="download")
+                self.state.save_document(link['url'], result['status'], result['path'],
+                                         result['content_hash'], result['size'])
+                self.stats["documents"] += result['status'] == "downloaded"
+            except Exception as e:
+                print(f"✗ Error downloading {link['url']}: {e}")
+                self.state.save_document(link['url'], "failed")
+            finally:
+                self.downloads.task_done()
+
+    async def worker(self, queue):
+        while True:
+            url = await queue.get()
+            host = urlparse(url).netloc
+            try:
+                await self.limiter.acquire(host)
+                try:
+                    print(f"Scraping: {url}")
+                    new_links = await self.scrape_page(url)
+                finally:
+                    self.limiter.release(host)
+                for link in new_links:
+                    self.enqueue(queue, link)
+                self.state.mark(url, "done")
+                self.pages_done += 1
             except Exception as e:
                 print(f"Error scraping {url}: {e}")
-                continue
+                self.state.mark(url, "failed")
+            finally:
+                queue.task_done()
+
+    async def crawl(self):
+        """Crawl the site with concurrent workers sharing a browser page pool"""
+        self.pages_done = 0
+        self.stats = {"static": 0, "rendered": 0, "unchanged": 0, "skipped": 0, "documents": 0}
+        self.browser = None
+        self.pages = asyncio.Queue()
+        self.pages_created = 0
+        self.page_lock = asyncio.Lock()
+        start = time.perf_counter()
+        queue = asyncio.Queue()
+        self.state = CrawlState(self.state_path)
+        self.visited_urls, pending = self.state.start(self.base_url, self.resume)
+        for url in pending:
+            queue.put_nowait(url)
+        self.enqueue(queue, self.base_url)
+        self.downloader = DocumentDownloader(self.session, known=self.state.stored_documents())
+        self.downloads = asyncio.Queue()
+        self.document_urls = set()
+        for link in self.state.pending_documents():
+            self.document_urls.add(link['url'])
+            self.downloads.put_nowait(link)
 
-        # Clean up
-        self.browser.close()
-        self.playwright.stop()
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.concurrency)]
+        workers += [asyncio.create_task(self.download_worker()) for _ in range(self.download_concurrency)]
+        try:
+            await queue.join()
+            await self.downloads.join()
+            self.state.finish()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # Checkpoint what was crawled so far, also when interrupted
+            self.state.close()
+            # Clean up
+            if self.browser is not None:
+                await self.browser.close()
+                await self.playwright.stop()
+
+        elapsed = time.perf_counter() - start
+        print(f"\nScraped {self.pages_done} pages in {elapsed:.1f}s ({self.pages_done / elapsed:.2f} pages/s, "
+              f"{self.stats['static']} static, {self.stats['rendered']} rendered, "
+              f"{self.stats['unchanged']} unchanged, {self.stats['skipped']} not pages, "
+              f"{self.stats['documents']} documents downloaded)")
+
+    def scrape(self):
+        """Main scraping method"""
+        asyncio.run(self.crawl())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,117 @@
+import re
+import time
+
+from prompts import critic_expert_prompt, multirelevance_expert_prompt
+
+HEDGE_RE = re.compile(
+    r"can(?:'|no)t find|cannot (?:find|answer)|not sure|don't know|do not know|"
+    r"no information|not mentioned|does not (?:contain|provide|mention)",
+    re.I
+)
+# Fixed beginnings of the expert prompts; their key/values can be cached
+RELEVANCE_PREFIX = f"{multirelevance_expert_prompt}\n"
+CRITIC_PREFIX = f"<s>[INST] {critic_expert_prompt}\n"
+
+
+def parse_relevance(output, num_retrievals):
+    """Parse "[1],[3]" / "[No]" into retrieval numbers; None if unparsable"""
+    if re.search(r"\[\s*No\s*\]", output, re.I):
+        return []
+    ids = [int(i) for i in re.findall(r"\[\s*(\d+)\s*\]", output)]
+    ids = [i for i in dict.fromkeys(ids) if 1 <= i <= num_retrievals]
+    return ids or None
+
+
+def parse_critic(output):
+    """True when the critic asks for more evidence"""
+    match = re.search(r"\b(True|False)\b", output)
+    return bool(match) and match.group(1) == "True"
+
+
+class SelfRAGPipeline:
+    """Retrieve, filter, generate and verify with the expert prompts.
+
+    One multirelevance call judges all retrievals at once and irrelevant
+    ones are dropped before generation. The critic then decides whether the
+    answer needs more evidence; only then is a wider retrieval run and the
+    answer regenerated. `max_expert_calls` caps relevance + critic calls per
+    request, and a first pass with enough relevant chunks and no hedging in
+    the answer exits without calling the critic.
+    """
+
+    def __init__(self, chatbot, max_expert_calls=3, candidates=5, confident_min_relevant=1,
+                 max_rounds=2):
+        self.chatbot = chatbot
+        self.max_expert_calls = max_expert_calls
+        self.candidates = candidates
+        self.confident_min_relevant = confident_min_relevant
+        self.max_rounds = max_rounds
+        chatbot.register_prefix(RELEVANCE_PREFIX)
+        chatbot.register_prefix(CRITIC_PREFIX)
+
+    def run(self, question):
+        start = time.perf_counter()
+        calls = []
+
+        def timed(stage, fn, *args, **kwargs):
+            stage_start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            calls.append({"stage": stage, "seconds": time.perf_counter() - stage_start})
+            return result
+
+        def expert_calls():
+            return sum(call["stage"] in ("relevance", "critic") for call in calls)
+
+        query = question
+        k = self.candidates
+        response, kept = "", []
+        for round_number in range(1, self.max_rounds + 1):
+            vector = timed("embed", self.chatbot.embeddings.embed_query, query)
+            docs = timed("retrieve", self.chatbot.retrieve, [query], [vector], k=k)[0]
+
+            relevant = None
+            if docs and expert_calls() < self.max_expert_calls:
+                retrievals = "\n".join(f"{i} {doc.page_content}" for i, doc in enumerate(docs, start=1))
+                prompt = (
+                    f"{RELEVANCE_PREFIX}Query: {question}\nGeneration: {response}\n"
+                    f"Retrievals:\n{retrievals}\nOutput: [/INST]"
+                )
+                output = timed("relevance", self.chatbot.generate, prompt, max_new_tokens=24)
+                relevant = parse_relevance(output, len(docs))
+            # Unparsable or skipped judgement: keep everything rather than guess
+            kept = docs if relevant is None else [docs[i - 1] for i in relevant]
+
+            augmented_prompt, sources, context = self.chatbot.build_prompt(question, kept)
+            response = timed("generate", self.chatbot.generate, augmented_prompt)
+
+            confident = (
+                relevant is not None
+                and len(relevant) >= self.confident_min_relevant
+                and not HEDGE_RE.search(response)
+            )
+            if round_number == 1 and confident:
+                break
+            if round_number == self.max_rounds or expert_calls() >= self.max_expert_calls:
+                break
+
+            evidence = "\n".join(doc.page_content for doc in kept)
+            prompt = (
+                f"{CRITIC_PREFIX}Query: {question}\nEvidence: {evidence}\n"
+                f"Generation: {response}\nOutput: [/INST]"
+            )
+            needs_evidence = parse_critic(timed("critic", self.chatbot.generate, prompt, max_new_tokens=8))
+            if not needs_evidence:
+                break
+            # Look again, wider, steering retrieval with what the draft answer talks about
+            query = f"{question}\n{response}"
+            k = self.candidates * 2
+
+        return {
+            "response": response,
+            "sources": sources,
+            "context": context,
+            "model_calls": sum(call["stage"] in ("relevance", "critic", "generate") for call in calls),
+            "expert_calls": expert_calls(),
+            "calls": calls,
+            "total_seconds": time.perf_counter() - start,
+        }
@@ -0,0 +1,84 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+_listeners = []
+_count_listeners = []
+
+
+def add_listener(listener):
+    """Call listener(stage, seconds) for every timed stage in any thread"""
+    _listeners.append(listener)
+
+
+def add_count_listener(listener):
+    """Call listener(name, amount) for every count, e.g. tokens, in any thread"""
+    _count_listeners.append(listener)
+
+
+def record(name, seconds):
+    """Report a stage measured elsewhere, e.g. by a model server"""
+    timer = getattr(_local, "timer", None)
+    if timer is not None:
+        timer.add(name, seconds)
+    for listener in _listeners:
+        listener(name, seconds)
+
+
+def count(name, amount):
+    """Add to a named per-request count such as prompt tokens"""
+    timer = getattr(_local, "timer", None)
+    if timer is not None:
+        timer.counts[name] = timer.counts.get(name, 0) + amount
+    for listener in _count_listeners:
+        listener(name, amount)
+
+
+def merge(stages, counts):
+    """Add stages and counts measured for this request elsewhere (another
+    thread or process) to the current request only; listeners already saw
+    them where the work ran"""
+    timer = getattr(_local, "timer", None)
+    if timer is None:
+        return
+    for name, seconds in stages.items():
+        timer.add(name, seconds)
+    for name, amount in counts.items():
+        timer.counts[name] = timer.counts.get(name, 0) + amount
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one named stage of the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+class StageTimer:
+    """Collect stage timings of the requests run in this thread.
+
+        with StageTimer() as timer:
+            chatbot.get_response(question)
+        timer.stages  # {"embed": 0.01, "retrieve": 0.002, ...}
+        timer.counts  # {"prompt_tokens": 812, "completion_tokens": 64}
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counts = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def __enter__(self):
+        self.previous = getattr(_local, "timer", None)
+        _local.timer = self
+        return self
+
+    def __exit__(self, *exc):
+        _local.timer = self.previous
+        return False
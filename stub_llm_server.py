@@ -0,0 +1,148 @@
+"""Minimal stand-in for an Ollama / OpenAI-compatible completion server.
+
+Answers /api/generate (Ollama) and /v1/completions (OpenAI), streaming or
+not, with canned text at a configurable per-token latency. Useful for
+testing and benchmarking the HTTP generation backend without a GPU:
+
+    python stub_llm_server.py --port 11434 --token-latency-ms 20
+    JUNCTION_GENERATION_BACKEND=ollama JUNCTION_GENERATION_URL=http://localhost:11434 \
+        JUNCTION_GENERATION_TOKENIZER=gpt2 python chat_app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = ("Based on the context, the answer is given in the retrieved documents. "
+          "This reply comes from the stub model server.")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client connection pooling is exercised
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json({"models": [{"name": self.server.model}]})
+        elif self.path == "/v1/models":
+            self.send_json({"object": "list", "data": [{"id": self.server.model, "object": "model"}]})
+        else:
+            self.send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/api/generate":
+            limit = request.get("options", {}).get("num_predict")
+            api = "ollama"
+        elif self.path == "/v1/completions":
+            limit = request.get("max_tokens")
+            api = "openai"
+        else:
+            self.send_json({"error": "not found"}, status=404)
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            words = ANSWER.split(" ")[:limit or None]
+            tokens = [word if i == 0 else " " + word for i, word in enumerate(words)]
+            # Whitespace words stand in for tokens in the reported usage
+            usage = {"prompt_tokens": len(request.get("prompt", "").split()), "completion_tokens": len(tokens)}
+            time.sleep(self.server.first_token_latency)
+            if request.get("stream"):
+                self.stream(api, tokens, usage)
+            else:
+                time.sleep(self.server.token_latency * len(tokens))
+                text = "".join(tokens)
+                if api == "ollama":
+                    self.send_json({"model": self.server.model, "response": text, "done": True,
+                                    **self.ollama_stats(usage)})
+                else:
+                    self.send_json({"object": "text_completion", "model": self.server.model,
+                                    "choices": [{"index": 0, "text": text, "finish_reason": "stop"}],
+                                    "usage": usage})
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def ollama_stats(self, usage):
+        return {
+            "prompt_eval_count": usage["prompt_tokens"],
+            "eval_count": usage["completion_tokens"],
+            "prompt_eval_duration": int(self.server.first_token_latency * 1e9),
+            "eval_duration": int(self.server.token_latency * usage["completion_tokens"] * 1e9),
+        }
+
+    def stream(self, api, tokens, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson" if api == "ollama" else "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(self.server.token_latency)
+            if api == "ollama":
+                self.send_chunk(json.dumps({"model": self.server.model, "response": token, "done": False}) + "\n")
+            else:
+                chunk = {"object": "text_completion", "choices": [{"index": 0, "text": token}]}
+                self.send_chunk(f"data: {json.dumps(chunk)}\n\n")
+        if api == "ollama":
+            self.send_chunk(json.dumps({"model": self.server.model, "response": "", "done": True,
+                                        **self.ollama_stats(usage)}) + "\n")
+        else:
+            self.send_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def serve(host="127.0.0.1", port=0, token_latency_ms=0, first_token_latency_ms=0, model="stub"):
+    """Start the stub server in a daemon thread and return it;
+    server.server_address[1] is the bound port"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.token_latency = token_latency_ms / 1000
+    server.first_token_latency = first_token_latency_ms / 1000
+    server.model = model
+    server.lock = threading.Lock()
+    server.requests = server.in_flight = server.max_in_flight = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Ollama/OpenAI-compatible completion server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--token-latency-ms", type=float, default=20)
+    parser.add_argument("--first-token-latency-ms", type=float, default=100)
+    parser.add_argument("--model", default="stub")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.token_latency_ms, args.first_token_latency_ms, args.model)
+    print(f"Stub model server listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()